@@ -271,9 +271,15 @@ set obs_en [open "./energy.dat" "w"] ;#saving the total energy and kinetic energ
 set vsf [open "./config.vsf" "w"] ;#saving the structure file
 set vtf [open "./config.vtf" "w"] ;#saving the trajectory file
 ###########################################################################################################
+set output_format "blockfile" ;#"blockfile": one text file per frame in ./config, "binary": float32 positions appended to ./config/positions.bin
+if {$output_format == "binary"} {
+set traj [open_binary_trajectory "./config" $n_part] ;#types are written once, see functions.tcl
+write_binary_frame $traj $n_part
+} else {
 set f [open "./config/config_0" "w"] ;#saving the configuration files
 blockfile $f write particles {id pos type}
 close $f
+}
 
 set tstart [setmd time]
 
@@ -295,9 +301,13 @@ for {set i 0} { $i < $n_equi } { incr i} {
 puts $obs_en "[expr $i] [analyze energy total] [analyze energy kinetic]"
 writevcf $vtf
 set j [expr $i+1]
+if {$output_format == "binary"} {
+write_binary_frame $traj $n_part
+} else {
 set f [open "./config/config_$j" "w"]
 blockfile $f write particles {id pos type}
 close $f
+}
 
 #saving the check point file
 set check_point [open "|gzip -c - > ./check_point/check_point.gz" "w"]
@@ -308,4 +318,7 @@ close $check_point
 close $obs_en
 close $vsf
 close $vtf
+if {$output_format == "binary"} {
+close $traj
+}
 ############################################################
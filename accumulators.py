@@ -0,0 +1,204 @@
+###############################################################################################################################################################
+#Running accumulators for per-frame results, so that the memory needed does not grow with the length of the trajectory.
+#WindowAccumulator keeps the last `window` rows (e.g. the last 3000 membership vectors) in a ring buffer together with their running sum.
+#RunningMean (exact sum and count) and Welford (mean and variance) summarise rows without storing them.
+#All accumulators can be merged, e.g. the results of worker processes or of different replicates,
+#and RunningMean and Welford can be saved to / loaded from .npz files to merge replicates after the runs.
+#Usage: python accumulators.py   (checks that merged accumulators equal a single accumulator fed with all rows)
+###############################################################################################################################################################
+
+import numpy as np
+
+
+class WindowAccumulator:
+    """
+    Trailing window over per-frame rows of a fixed shape.
+    The memory is window x row size, independent of the number of frames added.
+    Integer rows (e.g. 0/1 membership) are summed exactly in int64, so mean() equals the mean of the stored rows.
+    """
+
+    def __init__(self, shape=(), window=3000, dtype=np.float64):
+        self.window = window
+        self.shape = (shape,) if isinstance(shape, int) else tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.buffer = np.zeros((window,) + self.shape, dtype=self.dtype)
+        sum_dtype = np.int64 if np.issubdtype(self.dtype, np.integer) else np.float64
+        self.sum = np.zeros(self.shape, dtype=sum_dtype)
+        self.count = 0 #number of rows currently in the window
+        self.total = 0 #number of rows added since the start
+
+    def add(self, row):
+        slot = self.total % self.window
+        if self.count == self.window:
+            self.sum -= self.buffer[slot]
+        else:
+            self.count += 1
+        self.buffer[slot] = row
+        self.sum += self.buffer[slot]
+        self.total += 1
+
+    def values(self):
+        """Rows of the window in the order they were added."""
+        if self.count < self.window:
+            return self.buffer[:self.count].copy()
+        start = self.total % self.window
+        return np.concatenate([self.buffer[start:], self.buffer[:start]])
+
+    def last(self):
+        if not self.count:
+            raise IndexError("no rows added")
+        return self.buffer[(self.total - 1) % self.window]
+
+    def mean(self):
+        """Mean over the rows of the window. Float rows are averaged from the stored values to avoid drift of the running sum."""
+        if not self.count:
+            raise ValueError("no rows added")
+        if self.sum.dtype == np.int64:
+            return self.sum / self.count
+        return self.values().mean(axis=0)
+
+    def __len__(self):
+        return self.count
+
+    def merge(self, other):
+        """Append the rows of other, which covers the frames after the ones in self (e.g. the next block of a run)."""
+        rows = np.concatenate([self.values(), other.values()])[-self.window:]
+        self.total += other.total
+        self.count = len(rows)
+        #the oldest row goes to the slot the next add() overwrites once the window is full
+        slots = (self.total - self.count + np.arange(self.count)) % self.window
+        self.buffer[slots] = rows
+        self.sum = rows.sum(axis=0, dtype=self.sum.dtype)
+        return self
+
+    def running_mean(self):
+        """RunningMean of the rows currently in the window."""
+        return RunningMean(self.shape, sum=self.sum.copy(), count=self.count)
+
+
+class RunningMean:
+    """Sum and count of per-frame rows. Integer rows are summed exactly, so merging replicates gives the exact pooled mean."""
+
+    def __init__(self, shape=(), dtype=np.float64, sum=None, count=0):
+        self.shape = (shape,) if isinstance(shape, int) else tuple(shape)
+        sum_dtype = np.int64 if np.issubdtype(np.dtype(dtype), np.integer) else np.float64
+        self.sum = np.zeros(self.shape, dtype=sum_dtype) if sum is None else np.asarray(sum)
+        self.count = count
+
+    def add(self, row):
+        self.sum = self.sum + row
+        self.count += 1
+
+    def merge(self, other):
+        self.sum = self.sum + other.sum
+        self.count += other.count
+        return self
+
+    def mean(self):
+        if not self.count:
+            raise ValueError("no rows added")
+        return self.sum / self.count
+
+    def save(self, path):
+        np.savez(path, kind="RunningMean", sum=self.sum, count=self.count)
+
+    @classmethod
+    def from_arrays(cls, data):
+        return cls(data["sum"].shape, sum=data["sum"], count=int(data["count"]))
+
+
+class Welford:
+    """
+    Running mean and variance (Welford's algorithm), elementwise for array valued rows.
+    merge uses the pairwise update of Chan et al., so partial results of workers or replicates combine exactly as if all values had been added to one accumulator.
+    """
+
+    def __init__(self, shape=()):
+        self.shape = (shape,) if isinstance(shape, int) else tuple(shape)
+        self.count = 0
+        self.mean = np.zeros(self.shape)
+        self.m2 = np.zeros(self.shape)
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean = self.mean + delta / self.count
+        self.m2 = self.m2 + delta * (value - self.mean)
+
+    def add_many(self, values):
+        """Add a block of values (first axis = frames) in one step."""
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return self
+        block = Welford(self.shape)
+        block.count = len(values)
+        block.mean = values.mean(axis=0)
+        block.m2 = ((values - block.mean) ** 2).sum(axis=0)
+        return self.merge(block)
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    def variance(self, ddof=0):
+        if self.count <= ddof:
+            raise ValueError("not enough values")
+        return self.m2 / (self.count - ddof)
+
+    def std(self, ddof=0):
+        """Standard deviation; ddof=0 as np.std."""
+        return np.sqrt(self.variance(ddof))
+
+    def save(self, path):
+        np.savez(path, kind="Welford", count=self.count, mean=self.mean, m2=self.m2)
+
+    @classmethod
+    def from_arrays(cls, data):
+        accumulator = cls(data["mean"].shape)
+        accumulator.count = int(data["count"])
+        accumulator.mean = data["mean"]
+        accumulator.m2 = data["m2"]
+        return accumulator
+
+
+def load_accumulator(path):
+    """Load a RunningMean or Welford saved with .save(path)."""
+    with np.load(path) as data:
+        kinds = {"RunningMean": RunningMean, "Welford": Welford}
+        return kinds[str(data["kind"])].from_arrays(data)
+
+
+def merge_saved(paths):
+    """Load and merge the accumulators saved in paths (e.g. one file per replicate)."""
+    merged = None
+    for path in paths:
+        accumulator = load_accumulator(path)
+        merged = accumulator if merged is None else merged.merge(accumulator)
+    return merged
+
+
+def check_merge(n_rows=5, window=3, split=0):
+    """Compare a WindowAccumulator merged from two parts with one fed with all rows: values(), last() and a following add()."""
+    whole, first, second = (WindowAccumulator(window=window, dtype=np.int64) for _ in range(3))
+    for k in range(n_rows):
+        whole.add(k)
+        (first if k < split else second).add(k)
+    merged = first.merge(second)
+    assert np.array_equal(merged.values(), whole.values()), (merged.values(), whole.values())
+    assert merged.last() == whole.last() and merged.mean() == whole.mean()
+    merged.add(99)
+    whole.add(99)
+    assert np.array_equal(merged.values(), whole.values()), (merged.values(), whole.values())
+
+
+if __name__ == "__main__":
+    for n_rows in range(1, 9):
+        for split in range(n_rows + 1):
+            check_merge(n_rows, window=3, split=split)
+    print("merge checks passed")
@@ -0,0 +1,73 @@
+###############################################################################################################################################################
+#Agreement and speed of the grid condensate detection (condensate_detection.grid_labels) against DBSCAN with the per-frame eps.
+#Every frame is read once and clustered with both methods; reported per frame are the fraction of monomers and of all particles which both
+#methods put inside or outside a cluster, the number of clusters and the clustering time of each method. The probability profiles of the
+#run are compared as in benchmark_epsilon.py (largest and mean absolute change of the monomer probabilities). Per-frame rows are written
+#to detection_agreement.csv when an output file is given.
+#Usage: python benchmarks/benchmark_detection.py [config directory or trajectory cache] [output csv]
+###############################################################################################################################################################
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from condensate_detection import cluster_frame
+from trajectory_cache import load_frame, frame_name, list_frame_refs
+from bond_forces import monomer_index
+from membership_store import membership_rows
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Sample output files")
+
+
+def timed_labels(positions, types, method):
+    start = time.perf_counter()
+    epsilon, labels = cluster_frame(positions, method=method, types=types)
+    return time.perf_counter() - start, labels
+
+
+def compare_frame(ref):
+    """Agreement of the grid and DBSCAN labels of one frame, and the monomer membership of both."""
+    f, particle_ids, positions, types = load_frame(ref)
+    dbscan_time, dbscan = timed_labels(positions, types, "dbscan")
+    grid_time, grid = timed_labels(positions, types, "grid")
+    monomers = monomer_index(particle_ids)
+    row = {'filename': os.path.basename(frame_name(ref)),
+           'monomer_agreement': np.mean((dbscan[monomers] >= 0) == (grid[monomers] >= 0)),
+           'particle_agreement': np.mean((dbscan >= 0) == (grid >= 0)),
+           'dbscan_clusters': int(dbscan.max()) + 1, 'grid_clusters': int(grid.max()) + 1,
+           'dbscan_ms': 1e3 * dbscan_time, 'grid_ms': 1e3 * grid_time}
+    return row, membership_rows(dbscan, particle_ids), membership_rows(grid, particle_ids)
+
+
+def main(source=DEFAULT_DIRECTORY, output=None):
+    rows, dbscan_membership, grid_membership = [], [], []
+    for ref in list_frame_refs(source):
+        row, dbscan, grid = compare_frame(ref)
+        rows.append(row)
+        dbscan_membership.append(dbscan)
+        grid_membership.append(grid)
+    if not rows:
+        raise ValueError(f"No configuration files found in {source}")
+    table = pd.DataFrame(rows)
+    if output:
+        table.to_csv(output, index=False)
+
+    dp = np.abs(np.mean(grid_membership, axis=0) - np.mean(dbscan_membership, axis=0))
+    print(f"{len(table)} frames")
+    print(f"{'monomer agreement':<24}{table['monomer_agreement'].mean():>10.4f}  (worst frame {table['monomer_agreement'].min():.4f})")
+    print(f"{'particle agreement':<24}{table['particle_agreement'].mean():>10.4f}  (worst frame {table['particle_agreement'].min():.4f})")
+    print(f"{'same number of clusters':<24}{np.mean(table['dbscan_clusters'] == table['grid_clusters']):>10.4f}")
+    print(f"{'probability max |dp|':<24}{dp.max():>10.4f}")
+    print(f"{'probability mean |dp|':<24}{dp.mean():>10.4f}")
+    print(f"{'ms per frame':<24}{table['dbscan_ms'].mean():>10.2f} dbscan, {table['grid_ms'].mean():.2f} grid "
+          f"(speedup {table['dbscan_ms'].sum() / table['grid_ms'].sum():.1f})")
+    return table
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DIRECTORY
+    output = sys.argv[2] if len(sys.argv) > 2 else None
+    main(source, output)
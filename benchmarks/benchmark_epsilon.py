@@ -0,0 +1,46 @@
+###############################################################################################################################################################
+#Speed and accuracy of the eps estimation modes (frame, block, global) of condensate_detection.epsilon_schedule.
+#For every mode the probability profile of the run is computed and compared with the per-frame eps profile:
+#the largest and mean absolute change of the monomer probabilities and of eps are reported together with the run time.
+#Usage: python benchmarks/benchmark_epsilon.py [config directory or trajectory cache] [block sizes, e.g. 10,50]
+###############################################################################################################################################################
+
+import os
+import sys
+import time
+from functools import partial
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from condensate_detection import epsilon_schedule, CLUSTERING_PARAMS
+from result_store import cached_frames
+from probability_calculation import process_frame
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Sample output files")
+
+
+def run_mode(source, mode, block_size=100, sample_size=20):
+    start = time.perf_counter()
+    schedule = partial(epsilon_schedule, mode=mode, block_size=block_size, sample_size=sample_size)
+    epsilons, membership = [], []
+    for ref, record, timer in cached_frames(process_frame, source, None, "probability", CLUSTERING_PARAMS, schedule=schedule):
+        epsilons.append(float(record['epsilon']))
+        membership.append(record['membership'])
+    return time.perf_counter() - start, np.array(epsilons), np.mean(membership, axis=0)
+
+
+def main(source=DEFAULT_DIRECTORY, block_sizes=(10, 25)):
+    reference_time, reference_eps, reference_probability = run_mode(source, "frame")
+    print(f"{'mode':<14}{'time [s]':>10}{'speedup':>9}{'max |dp|':>10}{'mean |dp|':>11}{'mean |d eps|':>14}")
+    print(f"{'frame':<14}{reference_time:>10.2f}{1:>9.2f}{0:>10.4f}{0:>11.4f}{0:>14.4f}")
+    modes = [(f"block {k}", "block", k) for k in block_sizes] + [("global", "global", None)]
+    for name, mode, block_size in modes:
+        elapsed, eps, probability = run_mode(source, mode, block_size=block_size or 100)
+        dp = np.abs(probability - reference_probability)
+        print(f"{name:<14}{elapsed:>10.2f}{reference_time / elapsed:>9.2f}{dp.max():>10.4f}{dp.mean():>11.4f}{np.abs(eps - reference_eps).mean():>14.4f}")
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DIRECTORY
+    block_sizes = tuple(int(k) for k in sys.argv[2].split(",")) if len(sys.argv) > 2 else (10, 25)
+    main(source, block_sizes)
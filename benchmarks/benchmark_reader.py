@@ -0,0 +1,83 @@
+###############################################################################################################################################################
+#Benchmark of the blockfile reader against the pandas read_csv path used by the analysis scripts.
+#"read_csv" reproduces force_calculation.py / probability_calculation.py (read_csv, drop first and last rows, convert positions to float).
+#"read_csv + regex" reproduces kymograph.process_configurations (per-column brace/tab stripping with str.replace).
+#Usage: python benchmarks/benchmark_reader.py [config directory] [repeats]
+###############################################################################################################################################################
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blockfile_reader import read_blockfile, list_frames
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Sample output files")
+
+
+def read_csv_path(f):
+    i = pd.read_csv(f, sep=" ", header=None, names=["index", "x_pos", "y_pos", "z_pos", "type"])
+    i = i.drop(0, axis=0)
+    b = len(i)
+    i = i.drop(b, axis=0)
+    i = i.drop('type', axis=1)
+    i = i.drop('index', axis=1)
+    return i.to_numpy(dtype=float)
+
+
+def read_csv_regex_path(f):
+    df = pd.read_csv(f, sep=" ", header=None, names=["particle_id", "x_pos", "y_pos", "z_pos", "type"])
+    df = df.drop([0, len(df)-1])
+    for col in df.columns:
+        df[col] = df[col].astype(str).str.replace(r'[\{\}\t]', '', regex=True)
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df = df.dropna()
+    return df[["x_pos", "y_pos", "z_pos"]].to_numpy()
+
+
+def blockfile_path(f):
+    return read_blockfile(f)[1]
+
+
+def blockfile_float32_path(f):
+    return read_blockfile(f, dtype=np.float32)[1]
+
+
+def time_reader(reader, frames, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for f in frames:
+            reader(f)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(directory=DEFAULT_DIRECTORY, repeats=3):
+    frames = list_frames(directory)
+    size = sum(os.path.getsize(f) for f in frames)
+
+    #make sure every reader sees the same coordinates before timing them
+    for f in frames[:3]:
+        reference = blockfile_path(f)
+        assert np.array_equal(read_csv_path(f), reference)
+        assert np.allclose(read_csv_regex_path(f), reference, rtol=0, atol=1e-9)
+
+    readers = [("read_csv", read_csv_path),
+               ("read_csv + regex", read_csv_regex_path),
+               ("blockfile (float64)", blockfile_path),
+               ("blockfile (float32)", blockfile_float32_path)]
+    baseline = None
+    print(f"{len(frames)} frames, {size / 1e6:.1f} MB, best of {repeats}")
+    for name, reader in readers:
+        elapsed = time_reader(reader, frames, repeats)
+        baseline = baseline or elapsed
+        print(f"{name:>22}: {1e3 * elapsed / len(frames):7.2f} ms/frame  {size / elapsed / 1e6:7.1f} MB/s  x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DIRECTORY
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    main(directory, repeats)
@@ -0,0 +1,150 @@
+###############################################################################################################################################################
+#Scaling benchmark of the whole analysis pipeline on synthetic trajectories (see synthetic_trajectory.py).
+#For every size (particles x frames) a trajectory is generated in a temporary directory and analysed in a fresh process by frame_engine.run_engine
+#with the force, probability and kymograph consumers; the stage times (read, neighbors, epsilon, dbscan, per-analysis work, writing and plotting)
+#come from its profile log. The interfaces and interfacial affinities of the per-frame membership rows are timed as the "interfaces" stage.
+#Every result is appended to a CSV history together with the commit and the machine, so the timings of different versions can be compared:
+#   python benchmarks/benchmark_suite.py --sizes 1000x20,8180x20,100000x20,8180x1000
+#   python benchmarks/benchmark_suite.py --compare      (ms per frame of the last commit against the previous one)
+###############################################################################################################################################################
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import force_calculation
+import probability_calculation
+import kymograph
+from frame_engine import run_engine
+from interfacial_affinity_calculation import interfacial_affinities
+from synthetic_trajectory import write_trajectory, REPO
+
+DEFAULT_SIZES = "1000x20,8180x20,30000x20,100000x20,8180x100,8180x1000"
+DEFAULT_RESULTS = os.path.join(REPO, "benchmarks", "benchmark_results.csv")
+
+
+def parse_sizes(sizes):
+    """'8180x100,1000x20' -> [(8180, 100), (1000, 20)]"""
+    return [tuple(int(v) for v in size.lower().split("x")) for size in sizes.split(",")]
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def benchmark_size(n_particles, n_frames, workers=1, seed=0):
+    """Stage times of one size; returns {stage: seconds} and the summary of the profile log."""
+    with tempfile.TemporaryDirectory() as scratch:
+        frames = os.path.join(scratch, "output_files")
+        output_dir = os.path.join(scratch, "analysis")
+        os.makedirs(output_dir)
+        write_trajectory(frames, n_particles, n_frames, seed=seed)
+        consumers = [force_calculation.ForceConsumer(output_dir),
+                     probability_calculation.ProbabilityConsumer(output_dir),
+                     kymograph.KymographConsumer(os.path.join(output_dir, "kymo.npz"), os.path.join(output_dir, "kymograph.svg"))]
+        log = os.path.join(scratch, "profile.jsonl")
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            run_engine(frames, consumers, workers, profile_log=log)
+        with open(log) as fh:
+            summary = json.loads(fh.readlines()[-1])
+
+        membership = consumers[1].matrix.values().astype(np.float64)
+        start = time.perf_counter()
+        interfacial_affinities(membership, np.ones(membership.shape[1]))
+        stages = dict(summary["stages"], interfaces=time.perf_counter() - start)
+    return stages, summary
+
+
+def benchmark_process(queue, *size):
+    #the exception of a failed size is sent back, so the parent does not wait for a result forever
+    try:
+        queue.put(benchmark_size(*size))
+    except Exception as e:
+        queue.put(e)
+
+
+def isolated_benchmark(n_particles, n_frames, workers=1, seed=0):
+    """
+    benchmark_size in a fresh process, so that the peak memory belongs to this size alone.
+    The process is not daemonic (unlike a Pool worker), so run_engine can start its own pool of workers.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=benchmark_process, args=(queue, n_particles, n_frames, workers, seed))
+    process.start()
+    try:
+        result = queue.get()
+    finally:
+        process.join()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def run_benchmarks(sizes, workers=1, seed=0, results_path=DEFAULT_RESULTS):
+    """Benchmark every (particles, frames) size and append the results to results_path; returns the new rows."""
+    run = {"date": datetime.datetime.now().isoformat(timespec="seconds"), "commit": current_commit(),
+           "host": platform.node(), "python": platform.python_version(), "numpy": np.__version__, "workers": workers}
+    rows = []
+    for n_particles, n_frames in sizes:
+        stages, summary = isolated_benchmark(n_particles, n_frames, workers, seed)
+        size = dict(run, particles=n_particles, frames=n_frames)
+        for stage, seconds in stages.items():
+            rows.append(dict(size, stage=stage, seconds=seconds, ms_per_frame=1e3 * seconds / n_frames))
+        rows.append(dict(size, stage="wall", seconds=summary["wall_seconds"], ms_per_frame=1e3 * summary["wall_seconds"] / n_frames,
+                         frames_per_second=summary["frames_per_second"], peak_rss_mb=summary["peak_rss_mb"]))
+        print(f"{n_particles:>7} particles x {n_frames:>6} frames: {summary['frames_per_second']:8.2f} frames/s, "
+              f"peak RSS {summary['peak_rss_mb']:.0f} MB")
+    rows = pd.DataFrame(rows)
+    rows.to_csv(results_path, mode="a", index=False, header=not os.path.isfile(results_path))
+    return rows
+
+
+def stage_table(rows):
+    """ms per frame of every stage (rows) for every size (columns)."""
+    return rows.pivot_table(index="stage", columns=["particles", "frames"], values="ms_per_frame", sort=False)
+
+
+def compare(results_path=DEFAULT_RESULTS):
+    """Ratio of the ms per frame of the last benchmarked commit to the previous one (< 1 is faster), for every stage and size."""
+    history = pd.read_csv(results_path)
+    commits = list(dict.fromkeys(history["commit"]))
+    if len(commits) < 2:
+        raise ValueError(f"{results_path} holds the results of {len(commits)} commit(s), at least 2 are needed")
+    previous, latest = commits[-2], commits[-1]
+    keys = ["stage", "particles", "frames"]
+    before = history[history["commit"] == previous].groupby(keys)["ms_per_frame"].min()
+    after = history[history["commit"] == latest].groupby(keys)["ms_per_frame"].min()
+    ratio = (after / before).dropna().rename("ratio").reset_index()
+    print(f"{latest} against {previous}")
+    return ratio.pivot_table(index="stage", columns=["particles", "frames"], values="ratio", sort=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stage timings of the analyses on synthetic trajectories of several sizes.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated particles x frames sizes, e.g. 8180x100,100000x20")
+    parser.add_argument("--workers", type=int, default=1, help="processes used for the per-frame work of each run")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic trajectories")
+    parser.add_argument("--results", default=DEFAULT_RESULTS, help="CSV history the results are appended to")
+    parser.add_argument("--compare", action="store_true", help="only compare the last two benchmarked commits in the history")
+    args = parser.parse_args()
+
+    pd.set_option("display.width", 200)
+    if args.compare:
+        print(compare(args.results).round(2))
+    else:
+        rows = run_benchmarks(parse_sizes(args.sizes), args.workers, args.seed, args.results)
+        print(stage_table(rows).round(2))
@@ -0,0 +1,89 @@
+###############################################################################################################################################################
+#Synthetic blockfile trajectories for the benchmarks, with any number of particles and frames.
+#Every frame holds the 500-monomer polymer of an initial configuration (config_Re_*.dat, homogeneous type 2) and proteins (type 24):
+#   droplet : droplet_fraction of the proteins, uniformly in a sphere around the middle of the polymer at the protein density of the sample runs
+#   cloud   : the other proteins, uniformly in the 80 x 80 x 600 box
+#The middle condensed_monomers monomers are placed inside the droplet. Positions are redrawn for every frame (the polymer is jittered),
+#so consecutive frames are as different as the saved frames of a run. The frames are not physical; they reproduce the sizes and the
+#dense/dilute structure which the cost of the analyses depends on.
+#Usage: python benchmarks/synthetic_trajectory.py /path/to/output_files/ [--particles 8180] [--frames 100] [--re 0.6]
+###############################################################################################################################################################
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_DIRECTORY = os.path.join(REPO, "Initial configuration files")
+N_MONO = 500
+MONOMER_TYPE = 2
+PROTEIN_TYPE = 24
+BOX = (80.0, 80.0, 600.0)
+DROPLET_DENSITY = 0.75 #proteins per sigma^3 inside the condensate of the sample runs
+
+
+def read_polymer(re=0.6):
+    """(500, 3) monomer positions of config_Re_<re>.dat."""
+    config = pd.read_csv(os.path.join(CONFIG_DIRECTORY, f"config_Re_{re}.dat"), header=None, names=["id", "x", "y", "z"])
+    return config[["x", "y", "z"]].to_numpy(dtype=np.float64)
+
+
+def uniform_sphere(rng, n, center, radius):
+    direction = rng.normal(size=(n, 3))
+    direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+    return center + direction * radius * rng.random((n, 1)) ** (1 / 3)
+
+
+def synthetic_frame(polymer, n_particles, rng, droplet_fraction=0.75, condensed_monomers=250, jitter=0.1):
+    """(ids, positions, types) of one frame with n_particles particles (at least the 500 monomers)."""
+    n_proteins = n_particles - N_MONO
+    if n_proteins < 0:
+        raise ValueError(f"a frame needs at least the {N_MONO} monomers, got {n_particles} particles")
+    n_droplet = int(round(droplet_fraction * n_proteins))
+    center = polymer[N_MONO // 2]
+    radius = (3 * max(n_droplet, 1) / (4 * np.pi * DROPLET_DENSITY)) ** (1 / 3)
+
+    monomers = polymer + rng.normal(scale=jitter, size=polymer.shape)
+    first = (N_MONO - condensed_monomers) // 2
+    monomers[first:first + condensed_monomers] = uniform_sphere(rng, condensed_monomers, center, radius)
+    droplet = uniform_sphere(rng, n_droplet, center, radius)
+    cloud = rng.random((n_proteins - n_droplet, 3)) * BOX
+    positions = np.clip(np.concatenate([monomers, droplet, cloud]), 0, BOX)
+    types = np.concatenate([np.full(N_MONO, MONOMER_TYPE), np.full(n_proteins, PROTEIN_TYPE)])
+    return np.arange(n_particles), positions, types
+
+
+def format_blockfile(ids, positions, types):
+    """Text of a configuration as written by `blockfile $f write particles {id pos type}`."""
+    rows = "\n".join(f"\t{{{i} {x!r} {y!r} {z!r} {t}}}" for i, (x, y, z), t in zip(ids.tolist(), positions.tolist(), types.tolist()))
+    return "{particles {id pos type} \n" + rows + "\n}\n"
+
+
+def write_trajectory(directory, n_particles=8180, n_frames=100, re=0.6, seed=0, first_frame=0, **frame_options):
+    """Write n_frames configurations config_<k> to directory; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    polymer = read_polymer(re)
+    paths = []
+    for k in range(first_frame, first_frame + n_frames):
+        rng = np.random.default_rng([seed, k])
+        path = os.path.join(directory, f"config_{k}")
+        with open(path, "w") as fh:
+            fh.write(format_blockfile(*synthetic_frame(polymer, n_particles, rng, **frame_options)))
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic blockfile frames (polymer, protein droplet and dilute proteins).")
+    parser.add_argument("directory", help="output directory of the config_* files")
+    parser.add_argument("--particles", type=int, default=8180, help="particles per frame, the 500 monomers included")
+    parser.add_argument("--frames", type=int, default=100, help="number of frames")
+    parser.add_argument("--re", default="0.6", help="Re of the initial polymer configuration (config_Re_<re>.dat)")
+    parser.add_argument("--droplet-fraction", type=float, default=0.75, help="fraction of the proteins inside the droplet")
+    parser.add_argument("--condensed-monomers", type=int, default=250, help="monomers inside the droplet")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_trajectory(args.directory, args.particles, args.frames, args.re, args.seed,
+                     droplet_fraction=args.droplet_fraction, condensed_monomers=args.condensed_monomers)
@@ -0,0 +1,114 @@
+###############################################################################################################################################################
+#Reader for the compact binary trajectories written by the simulation scripts with output_format "binary" (open_binary_trajectory and
+#write_binary_frame in functions.tcl). A binary trajectory is a directory containing:
+#   types.bin     : number of particles n and number of the first frame (int32), the particle ids (n x int32) and their types (n x int8),
+#                   written once per run
+#   positions.bin : one frame after the other, x y z of every particle as float32 (12 bytes per particle and frame), all little endian
+#Frame k corresponds to the text file config_<first + k> of a blockfile run (the simulation scripts start at config_0).
+#8180 particles take 98 KB per frame instead of ~540 KB of text.
+#positions.bin is memory-mapped, so reading a frame is a view on the file; a frame which is still being written is not listed.
+#Binary trajectories are accepted wherever a trajectory cache is (see trajectory_cache.list_frame_refs).
+#Usage: python binary_trajectory.py /path/to/output_files/ /path/to/run.bin   (converts a directory of config_* text files)
+###############################################################################################################################################################
+
+import argparse
+import os
+import numpy as np
+from blockfile_reader import read_blockfile, list_frames, frame_number
+
+TYPES = "types.bin"
+POSITIONS = "positions.bin"
+POSITION_DTYPE = np.dtype("<f4")
+
+
+def is_binary_trajectory(path):
+    return os.path.isfile(os.path.join(path, TYPES)) and os.path.isfile(os.path.join(path, POSITIONS))
+
+
+def read_types(path):
+    """(ids, types, first frame number) of a binary trajectory; ids and types as int32 and int8 arrays."""
+    with open(os.path.join(path, TYPES), "rb") as fh:
+        raw = fh.read()
+    n, first = (int(v) for v in np.frombuffer(raw, dtype="<i4", count=2))
+    if len(raw) != 8 + 5 * n:
+        raise ValueError(f"{os.path.join(path, TYPES)} is truncated")
+    ids = np.frombuffer(raw, dtype="<i4", count=n, offset=8).astype(np.int32)
+    types = np.frombuffer(raw, dtype=np.int8, count=n, offset=8 + 4 * n).copy()
+    return ids, types, first
+
+
+class BinaryTrajectory:
+    """Read-only view of a binary trajectory, with the interface of trajectory_cache.Trajectory."""
+
+    def __init__(self, path):
+        self.path = path
+        self.ids, self.types, self.first = read_types(path)
+        self.frame_bytes = len(self.ids) * 3 * POSITION_DTYPE.itemsize
+        self._positions = None
+
+    def __len__(self):
+        #complete frames only; the simulation may be appending the next one
+        return os.path.getsize(os.path.join(self.path, POSITIONS)) // self.frame_bytes
+
+    @property
+    def positions(self):
+        """(frames, particles, 3) float32 positions, memory-mapped; mapped again when frames have been added."""
+        n = len(self)
+        if self._positions is None or len(self._positions) != n:
+            if not n:
+                return np.zeros((0, len(self.ids), 3), dtype=POSITION_DTYPE)
+            self._positions = np.memmap(os.path.join(self.path, POSITIONS), dtype=POSITION_DTYPE, mode="r", shape=(n, len(self.ids), 3))
+        return self._positions
+
+    @property
+    def frame_numbers(self):
+        return np.arange(self.first, self.first + len(self), dtype=np.int64)
+
+    @property
+    def filenames(self):
+        return [f"config_{number}" for number in self.frame_numbers]
+
+    def frame(self, k):
+        positions = self._positions if self._positions is not None and k < len(self._positions) else self.positions
+        return self.ids, positions[k], self.types
+
+    def lookup(self, number):
+        """Position in the trajectory of the frame config_<number>."""
+        if not 0 <= number - self.first < len(self):
+            raise KeyError(number)
+        return int(number - self.first)
+
+    def signature(self, k):
+        """Signature of frame k for the result store; frames are never rewritten, so the start of the run (types.bin) identifies them."""
+        st = os.stat(os.path.join(self.path, TYPES))
+        return f"{st.st_mtime_ns}:{self.frame_bytes}:{k}"
+
+
+def convert_directory(directory, path):
+    """Write the config_* text frames of directory (consecutive frame numbers) as a binary trajectory; returns the number of frames."""
+    frames = list_frames(directory)
+    if not frames:
+        raise ValueError(f"no configuration files found in {directory}")
+    numbers = [frame_number(f) for f in frames]
+    if numbers != list(range(numbers[0], numbers[0] + len(numbers))):
+        raise ValueError(f"the frames of {directory} are not consecutive")
+    os.makedirs(path, exist_ok=True)
+    ids, positions, types = read_blockfile(frames[0])
+    with open(os.path.join(path, TYPES), "wb") as fh:
+        fh.write(np.array([len(ids), numbers[0]], dtype="<i4").tobytes() + ids.astype("<i4").tobytes() + types.astype(np.int8).tobytes())
+    with open(os.path.join(path, POSITIONS), "wb") as fh:
+        for f in frames:
+            frame_ids, positions, frame_types = read_blockfile(f)
+            if not (np.array_equal(frame_ids, ids) and np.array_equal(frame_types, types)):
+                raise ValueError(f"{f} does not contain the same particles as {frames[0]}")
+            fh.write(positions.astype(POSITION_DTYPE).tobytes())
+    return len(frames)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a directory of config_* text frames to a binary trajectory.")
+    parser.add_argument("directory", help="directory with the config_* output files")
+    parser.add_argument("trajectory", help="binary trajectory directory to create")
+    args = parser.parse_args()
+    n = convert_directory(args.directory, args.trajectory)
+    print(f"{n} frames written to {args.trajectory}")
@@ -0,0 +1,133 @@
+###############################################################################################################################################################
+#Shared reader for the ESPResSo blockfile configurations written by the simulation scripts (`blockfile $f write particles {id pos type}`).
+#Each file starts with a "{particles {id pos type}" header line, has one "\t{id x y z type}" line per particle and ends with a closing "}" line.
+#The reader strips the braces and tabs directly on the raw bytes and converts the numbers in a single numpy call, so no pandas is needed.
+#It returns contiguous arrays: int32 particle ids, (N,3) float positions and int8 type ids.
+#read_blockfile_rows decodes only selected particle rows and stops reading the file after the last of them, e.g. the 500 monomers at the start
+#of every frame (about 6% of the file); the rows are found once with select_rows, since every frame lists the particles in the same order.
+###############################################################################################################################################################
+
+import os
+import re
+import numpy as np
+from natsort import natsorted
+
+#number of columns each blockfile particle property occupies
+FIELD_WIDTHS = {"id": 1, "type": 1, "pos": 3, "v": 3, "f": 3, "folded_position": 3, "q": 1, "mass": 1}
+
+_HEADER = re.compile(rb"\{\s*particles\s*\{([^}]*)\}")
+_STRIP = b"{}\t"
+
+
+def parse_header(raw):
+    """Return the list of particle fields named in the blockfile header, e.g. ['id', 'pos', 'type']."""
+    match = _HEADER.match(raw.lstrip())
+    if match is None:
+        raise ValueError("not an ESPResSo particles blockfile")
+    fields = match.group(1).decode().split()
+    unknown = [name for name in fields if name not in FIELD_WIDTHS]
+    if unknown:
+        raise ValueError(f"unsupported blockfile fields: {unknown}")
+    return fields
+
+
+def field_columns(fields):
+    """Map every field to its column slice in a parsed particle row."""
+    columns = {}
+    start = 0
+    for name in fields:
+        columns[name] = slice(start, start + FIELD_WIDTHS[name])
+        start += FIELD_WIDTHS[name]
+    return columns, start
+
+
+def parse_blockfile(raw, dtype=np.float64):
+    """
+    Parse the bytes of one blockfile configuration.
+    Returns (ids, positions, types) as int32 (N,), dtype (N,3) and int8 (N,) arrays.
+    """
+    fields = parse_header(raw)
+    for name in ("id", "pos", "type"):
+        if name not in fields:
+            raise ValueError(f"blockfile has no '{name}' field")
+    columns, width = field_columns(fields)
+
+    #drop the header line and the closing brace of the particles block
+    body = raw[raw.index(b"\n") + 1:raw.rindex(b"}")]
+    body = body.translate(None, _STRIP).decode("ascii")
+    values = np.fromstring(body, dtype=np.float64, sep=" ")
+    if values.size % width:
+        raise ValueError("truncated blockfile: particle rows are incomplete")
+    values = values.reshape(-1, width)
+
+    ids = values[:, columns["id"]].ravel().astype(np.int32)
+    positions = np.ascontiguousarray(values[:, columns["pos"]], dtype=dtype)
+    types = values[:, columns["type"]].ravel().astype(np.int8)
+    return ids, positions, types
+
+
+def read_blockfile(path, dtype=np.float64):
+    """Read one configuration file, see parse_blockfile."""
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    return parse_blockfile(raw, dtype=dtype)
+
+
+def select_rows(particle_ids, types, id_range=None, particle_types=None):
+    """
+    Sorted rows of a configuration holding the particles with id_range[0] <= id < id_range[1] and/or a type in particle_types,
+    e.g. select_rows(ids, types, id_range=(0, 500)) for the monomers.
+    """
+    keep = np.ones(len(particle_ids), dtype=bool)
+    if id_range is not None:
+        keep &= (particle_ids >= id_range[0]) & (particle_ids < id_range[1])
+    if particle_types is not None:
+        keep &= np.isin(types, list(particle_types))
+    return np.flatnonzero(keep)
+
+
+def read_blockfile_rows(path, rows, dtype=np.float64, chunk_size=1 << 16):
+    """
+    (ids, positions, types) of the particle rows `rows` (sorted, see select_rows) of one configuration file.
+    The file is read in chunks only up to the last requested row and only the requested lines are converted.
+    """
+    rows = np.asarray(rows)
+    n_lines = int(rows[-1]) + 2 if len(rows) else 1 #header line and particle rows 0 ... rows[-1]
+    chunks, n_newlines = [], 0
+    with open(path, "rb") as fh:
+        while n_newlines < n_lines:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            n_newlines += chunk.count(b"\n")
+    raw = b"".join(chunks)
+    fields = parse_header(raw)
+    columns, width = field_columns(fields)
+    lines = raw.split(b"\n", n_lines)[1:n_lines]
+    if len(lines) < n_lines - 1 or lines[-1].strip() == b"}":
+        raise ValueError(f"{path} has fewer than {n_lines - 1} particle rows")
+    selected = b"\n".join(lines[k] for k in rows.tolist()) if len(rows) < len(lines) else b"\n".join(lines)
+    values = np.fromstring(selected.translate(None, _STRIP).decode("ascii"), dtype=np.float64, sep=" ").reshape(-1, width)
+    ids = values[:, columns["id"]].ravel().astype(np.int32)
+    positions = np.ascontiguousarray(values[:, columns["pos"]], dtype=dtype)
+    types = values[:, columns["type"]].ravel().astype(np.int8)
+    return ids, positions, types
+
+
+def list_frames(directory):
+    """Configuration files of a run in natural sort order (config_0, config_1, ..., config_10)."""
+    frames = []
+    for filename in natsorted(os.listdir(directory)):
+        f = os.path.join(directory, filename)
+        if os.path.isfile(f):
+            frames.append(f)
+    return frames
+
+
+def frame_number(path):
+    """Frame index encoded in the file name, e.g. 5952 for config_5952."""
+    match = re.search(r"(\d+)$", os.path.basename(path))
+    if match is None:
+        raise ValueError(f"no frame number in {path}")
+    return int(match.group(1))
@@ -0,0 +1,66 @@
+###############################################################################################################################################################
+#Bond stretch and force on the bare DNA (bonds between consecutive monomers which are both outside the condensate).
+#All bonds of a configuration are handled in one vectorised pass over the (500,3) monomer positions.
+#The force follows force_calculation.py: tension = K * (mean bare bond length - l_0), converted from kBT/sigma to pN with 4.1/3.4.
+###############################################################################################################################################################
+
+import numpy as np
+
+N_MONO = 500 #number of monomers in the polymer, particle ids 0 ... 499
+K = 100 #harmonic bond constant (inter 0 harmonic 100. 1)
+KBT = 4.1 #pN nm
+SIGMA = 3.4 #nm, monomer size
+
+#mean bond length l_0 of the polymer in absence of proteins, for each normalised end-to-end distance Re (Re = 100 ... 500 of 500 sigma, see force_calculation.py)
+L0_BY_RE = {0.2: 1.09055, 0.4: 1.09059, 0.5: 1.09072, 0.6: 1.09093, 0.7: 1.09126, 0.8: 1.09133, 1.0: 1.09795}
+
+
+def rest_length(re):
+    """l_0 for the normalised end-to-end distance re (e.g. 0.6, as in config_Re_0.6.dat)."""
+    for known, l_0 in L0_BY_RE.items():
+        if abs(float(re) - known) < 1e-9:
+            return l_0
+    raise ValueError(f"no l_0 known for Re = {re}, known values: {sorted(L0_BY_RE)}")
+
+
+def monomer_index(particle_ids, n_mono=N_MONO):
+    """Rows of a configuration holding the monomers, ordered by particle id (positions[index] is the (n_mono,3) polymer)."""
+    rows = np.flatnonzero(particle_ids < n_mono)
+    rows = rows[np.argsort(particle_ids[rows])]
+    if len(rows) != n_mono:
+        raise ValueError(f"expected {n_mono} monomers, found {len(rows)}")
+    return rows
+
+
+def bond_lengths(monomers):
+    """Length of the n_mono - 1 bonds between consecutive monomers."""
+    return np.linalg.norm(np.diff(monomers, axis=0), axis=1)
+
+
+def bare_bond_lengths(monomers, outside):
+    """
+    Bond lengths with NaN for every bond which is not bare.
+    outside is a boolean mask over the monomers (True if the monomer is not part of the condensate);
+    bond k joins monomers k and k+1 and is bare when both of them are outside.
+    """
+    lengths = bond_lengths(monomers)
+    lengths[~(outside[1:] & outside[:-1])] = np.nan
+    return lengths
+
+
+def mean_bare_length(lengths):
+    """Mean of the bare bond lengths, None if the configuration has no bare bond."""
+    bare = lengths[~np.isnan(lengths)]
+    if not len(bare):
+        return None
+    return bare.mean()
+
+
+def tension(length, l_0, k=K):
+    """Tension in kBT/sigma for a bond length (scalar or array) and rest length l_0."""
+    return k * (np.asarray(length) - l_0)
+
+
+def force_pn(length, l_0, k=K):
+    """Force in pN for a bond length (scalar or array) and rest length l_0."""
+    return tension(length, l_0, k) * KBT / SIGMA
@@ -0,0 +1,155 @@
+###############################################################################################################################################################
+#Identity of the clusters over time. DBSCAN numbers the clusters of every frame independently; here the clusters of consecutive frames are matched
+#by the particles they share, so that a condensate keeps one track id and its history can be followed:
+#   two clusters are linked if they share at least MIN_OVERLAP of the members of the smaller one
+#   a cluster continues the track of the linked previous cluster with which it shares most particles; if that track is already taken, or if it has
+#   no linked previous cluster, it starts a new track
+#   birth : cluster without a linked previous cluster (e.g. a nucleating droplet)     death : previous cluster without a linked cluster
+#   merge : cluster linked to several previous clusters                               split : previous cluster linked to several clusters
+#The overlaps of all cluster pairs come from one bincount over the particles, so the matching is linear in the number of particles.
+#The labels are the ones the engine computes anyway (frame_engine.run_engine), tracking adds no clustering work.
+#Usage: python cluster_tracking.py [--min-overlap 0.5] [--workers N] [--store results.db]
+###############################################################################################################################################################
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from frame_engine import Consumer, run_engine
+from result_store import ResultStore
+from condensate_detection import add_epsilon_arguments
+
+MIN_OVERLAP = 0.5
+
+
+def labels_by_id(labels, particle_ids):
+    """Labels indexed by particle id, so that the frames can be compared particle by particle whatever the order in the files."""
+    ordered = np.full(int(particle_ids.max()) + 1, -1, dtype=np.int32)
+    ordered[particle_ids] = labels
+    return ordered
+
+
+def overlap_matrix(previous, current):
+    """(previous clusters, current clusters) matrix of the number of particles the clusters share."""
+    n = min(len(previous), len(current))
+    previous, current = previous[:n], current[:n]
+    n_prev, n_cur = int(previous.max(initial=-1)) + 1, int(current.max(initial=-1)) + 1
+    both = (previous > -1) & (current > -1)
+    keys = previous[both].astype(np.int64) * n_cur + current[both]
+    return np.bincount(keys, minlength=n_prev * n_cur).reshape(n_prev, n_cur)
+
+
+def cluster_sizes(labels):
+    return np.bincount(labels[labels > -1], minlength=int(labels.max(initial=-1)) + 1)
+
+
+class ClusterTracker:
+    """Assigns track ids to the clusters of successive frames and records birth, death, merge and split events."""
+
+    def __init__(self, min_overlap=MIN_OVERLAP):
+        self.min_overlap = min_overlap
+        self.previous = None
+        self.previous_tracks = np.zeros(0, dtype=np.int64)
+        self.n_tracks = 0
+
+    def _new_tracks(self, n):
+        tracks = np.arange(self.n_tracks, self.n_tracks + n)
+        self.n_tracks += n
+        return tracks
+
+    def update(self, labels):
+        """
+        Track ids of the clusters 0 ... n-1 of the next frame (labels indexed by particle id, see labels_by_id) and the events
+        since the previous frame as (event, track, related tracks) tuples.
+        """
+        sizes = cluster_sizes(labels)
+        if self.previous is None:
+            tracks = self._new_tracks(len(sizes))
+            events = [("birth", int(t), ()) for t in tracks]
+        else:
+            overlap = overlap_matrix(self.previous, labels)
+            smaller = np.minimum.outer(cluster_sizes(self.previous), sizes)
+            linked = overlap >= self.min_overlap * np.maximum(smaller, 1)
+            tracks = np.full(len(sizes), -1, dtype=np.int64)
+            events = []
+            #strongest links first, so that a track continues in the cluster which took most of its particles
+            a, b = np.nonzero(linked)
+            taken = np.zeros(len(self.previous_tracks), dtype=bool)
+            for k in np.argsort(-overlap[a, b], kind="stable"):
+                if tracks[b[k]] == -1 and not taken[a[k]]:
+                    tracks[b[k]] = self.previous_tracks[a[k]]
+                    taken[a[k]] = True
+            unmatched = np.flatnonzero(tracks == -1)
+            tracks[unmatched] = self._new_tracks(len(unmatched))
+            for c in range(len(sizes)):
+                parents = np.flatnonzero(linked[:, c])
+                if not len(parents):
+                    events.append(("birth", int(tracks[c]), ()))
+                elif len(parents) > 1:
+                    events.append(("merge", int(tracks[c]), tuple(int(t) for t in self.previous_tracks[parents])))
+            for p in range(len(self.previous_tracks)):
+                children = np.flatnonzero(linked[p])
+                if not len(children):
+                    events.append(("death", int(self.previous_tracks[p]), ()))
+                elif len(children) > 1:
+                    events.append(("split", int(self.previous_tracks[p]), tuple(int(t) for t in tracks[children])))
+        self.previous = labels
+        self.previous_tracks = tracks
+        return tracks, events
+
+
+def frame_labels(frame):
+    return {'labels': labels_by_id(frame.labels, frame.ids)}
+
+
+class TrackingConsumer(Consumer):
+    """Cluster tracks and lineage events for frame_engine.run_engine."""
+    name = "tracking"
+
+    def __init__(self, output_dir='/path/to/directory', min_overlap=MIN_OVERLAP):
+        self.output_dir = output_dir
+        self.tracker = ClusterTracker(min_overlap)
+        self.tracks = []
+        self.events = []
+
+    def recorder(self):
+        return frame_labels
+
+    def add(self, record):
+        k = len(self.tracks)
+        labels = record['labels']
+        tracks, events = self.tracker.update(labels)
+        self.tracks.append(pd.DataFrame({'frame': k, 'cluster': np.arange(len(tracks)), 'track': tracks, 'size': cluster_sizes(labels)}))
+        self.events.extend({'frame': k, 'event': event, 'track': track, 'related': ";".join(map(str, related))}
+                           for event, track, related in events)
+
+    def write(self):
+        """Writes cluster_tracks.csv (track of every cluster of every frame) and cluster_events.csv; returns both tables."""
+        tracks = pd.concat(self.tracks, ignore_index=True) if self.tracks else pd.DataFrame(columns=['frame', 'cluster', 'track', 'size'])
+        events = pd.DataFrame(self.events, columns=['frame', 'event', 'track', 'related'])
+        tracks.to_csv(os.path.join(self.output_dir, 'cluster_tracks.csv'), index=False)
+        events.to_csv(os.path.join(self.output_dir, 'cluster_events.csv'), index=False)
+        return tracks, events
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow the clusters from frame to frame and report their births, deaths, merges and splits.")
+    parser.add_argument("--min-overlap", type=float, default=MIN_OVERLAP, help="fraction of the smaller cluster two clusters must share to be linked")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes used for the per-frame clustering")
+    parser.add_argument("--store", help="SQLite file with per-frame results; only new or changed frames are analysed again")
+    add_epsilon_arguments(parser)
+    args = parser.parse_args()
+
+    # assigning directory (config_* files, or a trajectory cache made with trajectory_cache.py) and output directory
+    directory = '/path/to/output_files/'
+    output_dir = '/path/to/directory'
+
+    store = ResultStore(args.store) if args.store else None
+    n_frames, outputs = run_engine(directory, [TrackingConsumer(output_dir, args.min_overlap)], args.workers, store=store,
+                                   epsilon_mode=args.epsilon_mode, epsilon_block=args.epsilon_block, epsilon_sample=args.epsilon_sample,
+                                   method=args.method)
+    if store is not None:
+        store.close()
+    tracks, events = outputs["tracking"]
+    print(f"{tracks['track'].nunique()} tracks over {n_frames} frames")
+    print(events['event'].value_counts())
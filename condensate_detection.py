@@ -0,0 +1,253 @@
+###############################################################################################################################################################
+#Per-frame condensate detection shared by force_calculation.py and probability_calculation.py.
+#The DBSCAN parameter eps is taken at the knee (point of maximum curvature) of the smoothed 6th nearest neighbour distance curve.
+#DBSCAN then labels every particle with its cluster index, or -1 if the particle is not part of a cluster.
+#A single KD-tree per frame provides both the nearest neighbour distances and the eps-radius pairs that the DBSCAN labelling is computed from.
+#eps is estimated for every frame, once per block of frames or once per run (see epsilon_schedule).
+#The grid method is a linear-time alternative to DBSCAN: the proteins are counted on a grid of cells of the LJ cutoff size (2.5 sigma), cells with
+#at least GRID_PARAMS["threshold"] proteins per sigma^3 are dense, and every connected group of dense cells holding at least min_proteins
+#proteins is a cluster. Every particle, monomers included, takes the label of its cell. benchmarks/benchmark_detection.py compares both methods.
+#map_refs runs a per-frame function over the frames of a run, either serially or on a process pool, and returns the results in frame order.
+###############################################################################################################################################################
+
+from multiprocessing import Pool
+import numpy as np
+from scipy.spatial import cKDTree #for finding nearest neighbors
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.signal import savgol_filter
+from scipy import ndimage
+from trajectory_cache import load_frame
+from profiling import StageTimer
+
+
+#parameters of the eps estimation and clustering, used to key stored per-frame results (see result_store.py)
+CLUSTERING_PARAMS = {"min_samples": 6, "cutoff_value": 2.5, "window_length": 199, "polyorder": 3}
+#parameters of the grid method: cell edge (rcut of the protein-protein and monomer-protein LJ interactions), density threshold in proteins per
+#sigma^3 (0.75 inside the condensate, ~0.001 in the dilute phase) and the smallest number of proteins of a cluster (as min_samples)
+GRID_PARAMS = {"method": "grid", "cell": 2.5, "threshold": 0.1, "min_proteins": 6, "protein_type": 24}
+DETECTION_METHODS = ("dbscan", "grid")
+
+
+def detection_params(method="dbscan"):
+    """Parameters of the condensate detection method, used to key stored per-frame results."""
+    if method == "dbscan":
+        return CLUSTERING_PARAMS
+    if method == "grid":
+        return GRID_PARAMS
+    raise ValueError(f"unknown detection method {method!r}, expected one of {DETECTION_METHODS}")
+
+
+#for DBSCAN, given parameter Min_points = 2 * dimension [sander et al. 1998]
+#one KD-tree is built per frame; it answers both the 6th nearest neighbor query for eps and the eps-radius query for DBSCAN
+def build_index(i):
+    return cKDTree(i)
+
+#calculate distance with 6th nearest neighbor given Min_points = 6
+#the first neighbour of every particle is the particle itself (distance 0), as with sklearn's NearestNeighbors
+def calculate_nearest_neighbors(i, tree=None):
+    if tree is None:
+        tree = build_index(i)
+    distances, indices = tree.query(i, k=6)
+    return distances, indices
+
+#all particle pairs (p, q), p < q, which are not further apart than epsilon
+def radius_pairs(tree, epsilon):
+    return tree.query_pairs(epsilon, output_type='ndarray')
+
+def dbscan_labels(n, pairs, min_samples=6):
+    """
+    DBSCAN labels from the eps-radius pairs, identical to sklearn.cluster.DBSCAN(eps, min_samples).labels_.
+    Core points have at least min_samples particles (itself included) within eps and are joined into clusters by connected components.
+    Clusters are numbered in the order DBSCAN finds them, i.e. by their lowest core point index,
+    and a border point takes the first cluster that reaches it, i.e. the lowest label among its core neighbours.
+    """
+    labels = np.full(n, -1, dtype=np.int64)
+    p, q = pairs[:, 0], pairs[:, 1]
+    core = np.bincount(pairs.ravel(), minlength=n) + 1 >= min_samples
+    core_index = np.flatnonzero(core)
+    if not len(core_index):
+        return labels
+
+    linked = core[p] & core[q]
+    graph = coo_matrix((np.ones(linked.sum(), dtype=np.int8), (p[linked], q[linked])), shape=(n, n))
+    n_components, component = connected_components(graph, directed=False)
+    component_ids, first = np.unique(component[core_index], return_index=True)
+    rank = np.empty(n_components, dtype=np.int64)
+    rank[component_ids[np.argsort(first)]] = np.arange(len(component_ids))
+    labels[core_index] = rank[component[core_index]]
+
+    #border points: non-core particles with at least one core neighbour
+    border = np.full(n, np.iinfo(np.int64).max)
+    to_q = core[p] & ~core[q]
+    to_p = core[q] & ~core[p]
+    np.minimum.at(border, q[to_q], labels[p[to_q]])
+    np.minimum.at(border, p[to_p], labels[q[to_p]])
+    reached = border != np.iinfo(np.int64).max
+    labels[reached] = border[reached]
+    return labels
+
+#arrange the distance between pairs in asending order
+#as rcut for attractive LJ-potential is 2.5 sigma, any particle pair which has distance more than rcut is not interacting so it is removed from calculating eps parameter
+#only the 6th neighbour column is sorted (sorting every column and taking the 6th gives the same curve)
+def sort_and_filter_distances(distances, cutoff_value=2.5):
+    distances = np.sort(distances[:, 5])
+    distances = distances[distances <= cutoff_value]
+    return distances
+
+
+#as the k-distance curve has noise, point of maximum curvature can go to unreasonable values on the k-distance curve
+#here as a smoothing filter we are using savgol filter which fits a polynomial of given order to a given window of data points on the curve
+def smooth_data(distances):
+    x = range(len(distances))
+    smoothed_data = savgol_filter(distances, window_length=199, polyorder=3, mode='nearest')
+    return smoothed_data
+
+
+#the distance point on the curve for which the second derivative (curvature) is maximum (knee point) is treated as epsilon
+def calculate_derivatives(smoothed_data):
+    x = range(len(smoothed_data))
+    slope = np.gradient(smoothed_data, x)
+    second_derivative = np.gradient(slope, x)
+    return slope, second_derivative
+
+def find_max_curvature_point(distances, second_derivative):
+    max_curvature_index = np.argmax(second_derivative)
+    max_curvature_point = distances[max_curvature_index]
+    return max_curvature_index, max_curvature_point
+
+
+#knee of the k-distance curve (sorted and filtered 6th neighbour distances), used as eps
+def knee_epsilon(filtered_distances):
+    smoothed_distances = smooth_data(filtered_distances)
+    slope, second_derivative = calculate_derivatives(smoothed_distances)
+    max_curvature_index, max_curvature_point = find_max_curvature_point(filtered_distances, second_derivative)
+    return max_curvature_point
+
+
+def k_distances(i, tree=None):
+    """Sorted 6th neighbour distances of one frame below the LJ cutoff."""
+    distances, indices = calculate_nearest_neighbors(i, tree)
+    return sort_and_filter_distances(distances)
+
+
+def grid_labels(positions, types, cell=2.5, threshold=0.1, min_proteins=6, protein_type=24):
+    """
+    Cluster labels of all particles from the protein density on a grid, -1 outside the dense cells; linear in the number of particles.
+    Clusters are numbered by their lowest particle index, as with dbscan_labels.
+    """
+    cells = np.floor((positions - positions.min(axis=0)) / cell).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+    flat = np.ravel_multi_index(cells.T, dims)
+    counts = np.bincount(flat[types == protein_type], minlength=int(np.prod(dims)))
+    dense = (counts >= threshold * cell ** 3).reshape(dims)
+    component, n_components = ndimage.label(dense)
+    component = component.ravel()
+    proteins = np.bincount(component, weights=counts, minlength=n_components + 1)
+    kept = proteins >= min_proteins
+    kept[0] = False #cells outside all dense regions
+    particle_component = np.where(kept[component[flat]], component[flat], 0)
+
+    labels = np.full(len(positions), -1, dtype=np.int64)
+    clustered = np.flatnonzero(particle_component)
+    component_ids, first = np.unique(particle_component[clustered], return_index=True)
+    rank = np.zeros(n_components + 1, dtype=np.int64)
+    rank[component_ids[np.argsort(first)]] = np.arange(len(component_ids))
+    labels[clustered] = rank[particle_component[clustered]]
+    return labels
+
+
+def cluster_frame(i, timer=None, epsilon=None, method="dbscan", types=None):
+    """
+    Run the eps estimation and DBSCAN on the (N,3) positions of one frame. Returns (epsilon, labels).
+    If epsilon is given (per-block or global eps, see epsilon_schedule) the nearest neighbour search and knee search are skipped.
+    With method "grid" the labels come from grid_labels (types are needed) and eps is NaN.
+    Stage timings and the number of clusters and noise points are added to timer (profiling.StageTimer) when one is given.
+    """
+    if timer is None:
+        timer = StageTimer(enabled=False)
+    if method == "grid":
+        with timer.stage("grid"):
+            params = {k: v for k, v in GRID_PARAMS.items() if k != "method"}
+            labels = grid_labels(i, types, **params)
+        if timer.enabled:
+            timer.count("clusters", int(labels.max()) + 1)
+            timer.count("noise", int(np.count_nonzero(labels == -1)))
+        return np.nan, labels
+    with timer.stage("neighbors"):
+        tree = build_index(i)
+        if epsilon is None:
+            distances, indices = calculate_nearest_neighbors(i, tree)
+    if epsilon is None:
+        with timer.stage("epsilon"):
+            filtered_distances = sort_and_filter_distances(distances)
+            epsilon = knee_epsilon(filtered_distances)
+    with timer.stage("dbscan"):
+        pairs = radius_pairs(tree, epsilon)
+        labels = dbscan_labels(len(i), pairs, min_samples=6)
+    if timer.enabled:
+        timer.count("clusters", int(labels.max()) + 1)
+        timer.count("noise", int(np.count_nonzero(labels == -1)))
+    return epsilon, labels
+
+
+#eps can be estimated for every frame (as before), once per block of frames, or once for the whole run:
+#   frame  : knee of the k-distance curve of each frame
+#   block  : knee of the first frame of every block of block_size frames, reused for the rest of the block
+#   global : median of the knees of sample_size frames spread evenly over the run
+EPSILON_MODES = ("frame", "block", "global")
+
+
+def _frame_epsilon(ref):
+    f, particle_ids, i, types = load_frame(ref)
+    return knee_epsilon(k_distances(i))
+
+
+def epsilon_schedule(refs, mode="frame", block_size=100, sample_size=20, workers=1):
+    """
+    eps to use for every frame reference in refs, or None in frame mode (each frame estimates its own eps).
+    Only the frames which define an eps are read here: one per block, or sample_size frames for the global eps.
+    """
+    if mode == "frame" or not len(refs):
+        return None
+    if mode == "block":
+        starts = list(map_refs(_frame_epsilon, refs[::block_size], workers=workers))
+        return [starts[k // block_size] for k in range(len(refs))]
+    if mode == "global":
+        sample = sorted(set(np.linspace(0, len(refs) - 1, min(sample_size, len(refs))).astype(int)))
+        sampled = list(map_refs(_frame_epsilon, [refs[k] for k in sample], workers=workers))
+        return [float(np.median(sampled))] * len(refs)
+    raise ValueError(f"unknown eps mode {mode!r}, expected one of {EPSILON_MODES}")
+
+
+def add_epsilon_arguments(parser):
+    """Command line options of the condensate detection method and of the eps estimation, shared by the analysis scripts."""
+    parser.add_argument("--method", choices=DETECTION_METHODS, default="dbscan", help="condensate detection: DBSCAN, or the linear-time protein density grid")
+    parser.add_argument("--epsilon-mode", choices=EPSILON_MODES, default="frame", help="estimate eps for every frame, every block of frames or once per run")
+    parser.add_argument("--epsilon-block", type=int, default=100, help="frames per block in block mode")
+    parser.add_argument("--epsilon-sample", type=int, default=20, help="frames sampled for the global eps (median of their eps)")
+
+
+def _call_with_epsilon(item):
+    worker, ref, epsilon = item
+    return worker(ref, epsilon=epsilon)
+
+
+def map_refs(worker, refs, workers=1, chunksize=4, epsilons=None):
+    """
+    Apply worker to every frame reference in refs (see trajectory_cache.list_frame_refs).
+    worker must be a module level function (or a functools.partial of one) so that it can be sent to the worker processes.
+    With epsilons (one eps per reference, see epsilon_schedule) the worker is called as worker(ref, epsilon=eps).
+    With workers > 1 the frames are spread over a process pool; results are always yielded in the order of refs.
+    """
+    if epsilons is None:
+        function, items = worker, refs
+    else:
+        function, items = _call_with_epsilon, [(worker, ref, epsilon) for ref, epsilon in zip(refs, epsilons)]
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield function(item)
+        return
+    with Pool(processes=workers) as pool:
+        for result in pool.imap(function, items, chunksize=chunksize):
+            yield result
@@ -0,0 +1,116 @@
+###############################################################################################################################################################
+#DNA-only analysis: conformation of the polymer in every frame without reading or clustering the ~7,700 proteins.
+#Only the monomer rows of every frame are read (blockfile_reader.read_blockfile_rows; a slice of the memory map for a trajectory cache or
+#binary trajectory), which is about 6% of a text frame. For every frame:
+#   end_to_end         : distance between the first and the last monomer, extension_z its z component
+#   radius_of_gyration : of the monomers
+#   mean/max bond length and the force of the mean bond stretch of all bonds (bond_forces.force_pn; no condensate, so not the bare-DNA force)
+#and the z-profile of the monomers on the 2 sigma grid of the kymograph, averaged over the last 3000 frames.
+#--ids and --types select a part of the chain (e.g. --ids 100:300, or the monomers of one type of a heterogeneous DNA); the monomers are ordered
+#by particle id, end_to_end is taken between the first and the last selected monomer and only bonds between selected neighbours are counted.
+#Usage: python dna_conformation.py [--re 0.6] [--ids 0:500] [--types 2] [--workers N] [--store results.db]
+###############################################################################################################################################################
+
+import argparse
+import os
+from functools import partial
+import numpy as np
+import pandas as pd
+from bond_forces import N_MONO, bond_lengths, force_pn, rest_length
+from trajectory_cache import load_frame, frame_name, list_frame_refs
+from blockfile_reader import select_rows
+from result_store import ResultStore, cached_frames
+from accumulators import WindowAccumulator
+from kymograph import tethered_ends, kymograph_bins, bin_indices
+
+WINDOW = 3000
+
+
+def conformation(monomers, bonded=None):
+    """
+    (end-to-end distance, z extension, radius of gyration, mean bond length, max bond length) of the (n,3) monomers ordered by id.
+    bonded marks the n - 1 consecutive pairs which are bonded (all if None); the bond lengths are NaN without any bond.
+    """
+    end_to_end = monomers[-1] - monomers[0]
+    centered = monomers - monomers.mean(axis=0)
+    lengths = bond_lengths(monomers)
+    if bonded is not None:
+        lengths = lengths[bonded]
+    mean_length, max_length = (lengths.mean(), lengths.max()) if len(lengths) else (np.nan, np.nan)
+    return (np.linalg.norm(end_to_end), end_to_end[2], np.sqrt((centered ** 2).sum(axis=1).mean()), mean_length, max_length)
+
+
+def frame_record(ref, rows, bins, epsilon=None):
+    """Conformation and monomer z-histogram of one frame, reading only the particle rows `rows`; run in the worker processes."""
+    f, particle_ids, positions, types = load_frame(ref, rows=rows)
+    order = np.argsort(particle_ids)
+    monomers = positions[order]
+    index = bin_indices(monomers[:, 2], bins)
+    counts = np.bincount(index[index >= 0], minlength=len(bins) - 1)
+    return {'conformation': np.array(conformation(monomers, np.diff(particle_ids[order]) == 1)), 'z_counts': counts}, None
+
+
+def analyse_run(directory, output_dir='/path/to/directory', l_0=rest_length(0.6), id_range=(0, N_MONO), workers=1, store=None,
+                particle_types=None):
+    """
+    DNA conformation of every frame of directory (config_* files, trajectory cache or binary trajectory), from the selected monomer rows only.
+    Writes dna_conformation.dat and dna_z_profile.dat and returns (conformation table, z-profile table).
+    """
+    #the z grid comes from the tethered ends of the whole chain, so it is the kymograph grid for any selection
+    first = load_frame(list_frame_refs(directory)[0])
+    rows = select_rows(first[1], first[3], id_range, particle_types)
+    if not len(rows) or first[1][rows].max() >= N_MONO:
+        raise ValueError(f"the selection ids {id_range}, types {particle_types} must hold monomers only (ids 0 ... {N_MONO - 1})")
+    z_min, z_max, bins = kymograph_bins(*tethered_ends(first[1], first[2]))
+    worker = partial(frame_record, rows=rows, bins=bins)
+    params = {"id_range": list(id_range), "types": sorted(particle_types) if particle_types else None,
+              "bins": [float(z_min), float(z_max), len(bins)]}
+
+    names, values = [], []
+    profile = WindowAccumulator(len(bins) - 1, window=WINDOW, dtype=np.int64)
+    for ref, record, timer in cached_frames(worker, directory, store, "dna_conformation", params, workers=workers):
+        print(frame_name(ref))
+        names.append(os.path.basename(frame_name(ref)))
+        values.append(record['conformation'])
+        profile.add(record['z_counts'])
+    if not names:
+        raise ValueError(f"No configuration files found in {directory}")
+
+    table = pd.DataFrame(values, columns=['end_to_end', 'extension_z', 'radius_of_gyration', 'mean_bond_length', 'max_bond_length'])
+    table.insert(0, 'filename', names)
+    table['mean_bond_force'] = force_pn(table['mean_bond_length'], l_0)
+    z_profile = pd.DataFrame({'z': (bins[:-1] + bins[1:]) / 2, 'monomers': profile.mean()})
+    table.to_csv(os.path.join(output_dir, 'dna_conformation.dat'), index=False)
+    z_profile.to_csv(os.path.join(output_dir, 'dna_z_profile.dat'), index=False)
+    return table, z_profile
+
+
+def parse_id_range(text):
+    """'0:500' -> (0, 500)"""
+    start, stop = text.split(":")
+    return int(start), int(stop)
+
+
+def parse_types(text):
+    """'2,3' -> (2, 3)"""
+    return tuple(int(t) for t in text.split(","))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end distance, radius of gyration, bond stretch and z-profile of the DNA, reading only the monomers.")
+    parser.add_argument("--re", default="0.6", help="Re of the run, for l_0 of the bond force (see bond_forces.L0_BY_RE)")
+    parser.add_argument("--ids", type=parse_id_range, default=(0, N_MONO), help="particle id range start:stop of the monomers")
+    parser.add_argument("--types", type=parse_types, default=None, help="comma separated monomer type ids, e.g. 2,3 (default: all types)")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes reading the frames")
+    parser.add_argument("--store", help="SQLite file with per-frame results; only new or changed frames are analysed again")
+    args = parser.parse_args()
+
+    # assigning directory (config_* files, trajectory cache or binary trajectory) and output directory
+    directory = '/path/to/output_files/'
+    output_dir = '/path/to/directory'
+
+    store = ResultStore(args.store) if args.store else None
+    table, z_profile = analyse_run(directory, output_dir, rest_length(args.re), args.ids, args.workers, store, args.types)
+    if store is not None:
+        store.close()
+    print(table.describe())
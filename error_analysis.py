@@ -0,0 +1,218 @@
+###############################################################################################################################################################
+#Error bars for the per-frame time series of a run, taking the time correlation between frames into account:
+#   blocked standard errors (means of consecutive blocks of frames, and the Flyvbjerg-Petersen blocking curve),
+#   integrated autocorrelation times (FFT autocorrelation with Sokal's automatic window),
+#   moving block bootstrap confidence intervals, for the force, the probability of every monomer and the interfacial affinity.
+#All functions work on (frames,) or (frames, columns) arrays, e.g. the force series or the 0/1 membership of the 500 monomers,
+#and the bootstrap draws thousands of resamples at once from precomputed block sums.
+#The membership is taken from a bit-packed membership store (membership_store.py) or from the per-frame results stored by
+#probability_calculation.py --store or frame_engine.py / sweep.py --store, so nothing is clustered again.
+###############################################################################################################################################################
+
+import argparse
+import numpy as np
+import pandas as pd
+from result_store import ResultStore
+from trajectory_cache import frame_name, list_frame_refs
+from membership_store import MembershipStore
+from condensate_detection import detection_params, DETECTION_METHODS
+from interfacial_affinity_calculation import affinity_vector, parse_affinity, interfacial_affinities
+
+
+def block_means(x, n_blocks=20):
+    """Means of n_blocks consecutive blocks of equal length along the first axis (the last frames which do not fill a block are left out)."""
+    x = np.asarray(x, dtype=np.float64)
+    size = len(x) // n_blocks
+    if size < 1:
+        raise ValueError(f"{len(x)} frames cannot be split into {n_blocks} blocks")
+    return x[:size * n_blocks].reshape((n_blocks, size) + x.shape[1:]).mean(axis=1)
+
+
+def block_standard_error(x, n_blocks=20):
+    """Standard error of the mean from the scatter of the block means."""
+    means = block_means(x, n_blocks)
+    return means.std(axis=0, ddof=1) / np.sqrt(n_blocks)
+
+
+def blocking_curve(x):
+    """
+    Flyvbjerg-Petersen blocking: the series is halved repeatedly by averaging neighbouring frames.
+    Returns (block sizes, standard error at each level, uncertainty of that standard error); the standard error grows with the block size
+    until the blocks are longer than the correlation time and then stays on a plateau.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    sizes, errors, uncertainties = [], [], []
+    size = 1
+    while len(x) >= 4:
+        n = len(x)
+        se = x.std(axis=0, ddof=1) / np.sqrt(n)
+        sizes.append(size)
+        errors.append(se)
+        uncertainties.append(se / np.sqrt(2 * (n - 1)))
+        x = 0.5 * (x[:n // 2 * 2:2] + x[1:n // 2 * 2:2])
+        size *= 2
+    return np.array(sizes), np.array(errors), np.array(uncertainties)
+
+
+def autocorrelation(x):
+    """Normalised autocorrelation function along the first axis, from one FFT per column. Columns without variation give NaN."""
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    centered = x - x.mean(axis=0)
+    spectrum = np.fft.rfft(centered, n=2 * n, axis=0)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum), axis=0)[:n]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return acf / acf[0]
+
+
+def autocorrelation_time(x, c=5.0):
+    """
+    Integrated autocorrelation time tau = 1 + 2 sum_t rho(t) in frames, so that len(x) / tau is the number of independent frames.
+    The sum is cut at the first lag t >= c * tau(t) (Sokal). NaN for columns without variation.
+    """
+    rho = autocorrelation(x)
+    taus = 2 * np.cumsum(rho, axis=0) - 1
+    lags = np.arange(len(rho)).reshape((-1,) + (1,) * (rho.ndim - 1))
+    beyond = lags >= c * taus
+    window = np.where(beyond.any(axis=0), beyond.argmax(axis=0), len(rho) - 1)
+    return np.take_along_axis(taus, np.expand_dims(window, 0), axis=0)[0]
+
+
+def default_block_length(x):
+    """Block length of the bootstrap: the largest autocorrelation time of the columns, rounded up (1 for uncorrelated data)."""
+    tau = np.atleast_1d(autocorrelation_time(x))
+    tau = tau[np.isfinite(tau)]
+    return max(1, int(np.ceil(tau.max()))) if len(tau) else 1
+
+
+def block_bootstrap_means(x, n_resamples=1000, block_length=None, seed=None, chunk=256):
+    """
+    Moving block bootstrap of the mean along the first axis: every resample joins ceil(n / block_length) blocks of consecutive frames
+    with random starts. The block sums are precomputed, so a chunk of resamples is one (resamples x starts) @ (starts x columns) product.
+    Returns the resampled means, shape (n_resamples,) + x.shape[1:].
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    if block_length is None:
+        block_length = default_block_length(x)
+    block_length = min(block_length, n)
+    flat = x.reshape(n, -1)
+    cumulative = np.concatenate([np.zeros((1, flat.shape[1])), np.cumsum(flat, axis=0)])
+    block_sums = cumulative[block_length:] - cumulative[:-block_length]
+    n_starts = len(block_sums)
+    n_blocks = -(-n // block_length)
+    rng = np.random.default_rng(seed)
+    means = np.empty((n_resamples, flat.shape[1]))
+    for first in range(0, n_resamples, chunk):
+        size = min(chunk, n_resamples - first)
+        starts = rng.integers(0, n_starts, size=(size, n_blocks))
+        counts = np.bincount((starts + n_starts * np.arange(size)[:, None]).ravel(), minlength=size * n_starts).reshape(size, n_starts)
+        means[first:first + size] = counts @ block_sums / (n_blocks * block_length)
+    return means.reshape((n_resamples,) + x.shape[1:])
+
+
+def confidence_interval(samples, ci=0.95):
+    """Percentile interval (low, high) of bootstrap samples along the first axis."""
+    alpha = (1 - ci) / 2
+    return np.nanquantile(samples, alpha, axis=0), np.nanquantile(samples, 1 - alpha, axis=0)
+
+
+def summarize(x, n_blocks=20, n_resamples=1000, block_length=None, ci=0.95, seed=None):
+    """Mean, naive and blocked standard error, autocorrelation time and bootstrap interval of every column of x as a DataFrame."""
+    x = np.asarray(x, dtype=np.float64)
+    columns = x.reshape(len(x), -1)
+    if block_length is None:
+        block_length = default_block_length(columns)
+    low, high = confidence_interval(block_bootstrap_means(columns, n_resamples, block_length, seed), ci)
+    return pd.DataFrame({'mean': columns.mean(axis=0),
+                         'std': columns.std(axis=0),
+                         'se_naive': columns.std(axis=0, ddof=1) / np.sqrt(len(columns)),
+                         'se_block': block_standard_error(columns, n_blocks),
+                         'tau': autocorrelation_time(columns),
+                         'ci_low': low,
+                         'ci_high': high,
+                         'block_length': block_length})
+
+
+def affinity_bootstrap(membership, aff, n_resamples=1000, block_length=None, seed=None):
+    """
+    Bootstrap distribution of the left and right interfacial affinity: the interfaces of every resampled probability profile
+    (block bootstrap of the (frames, monomers) membership) are found in one batch. Returns an (n_resamples, 2) array.
+    """
+    profiles = block_bootstrap_means(membership, n_resamples, block_length, seed)
+    left, right, left_aff, right_aff = interfacial_affinities(profiles, aff)
+    return np.column_stack([left_aff, right_aff])
+
+
+def membership_keys(analyses):
+    """(analysis, record key) of the stored records holding the monomer membership: probability_calculation.py and engine runs with the probability consumer."""
+    keys = [("probability", "membership")] if "probability" in analyses else []
+    return keys + [(a, "probability.membership") for a in analyses if a.startswith("engine:") and "probability" in a[len("engine:"):].split(",")]
+
+
+def stored_membership(directory, store, window=3000, method="dbscan"):
+    """
+    (frames, monomers) membership of the last window frames, from the records stored by probability_calculation.py --store
+    or frame_engine.py / sweep.py --store (with the probability consumer) with the detection method, whatever their eps setting.
+    Nothing is clustered: a frame without such a record raises a ValueError.
+    """
+    detection = detection_params(method)
+    keys = membership_keys(store.analyses())
+    rows = []
+    for ref in list_frame_refs(directory)[-window:]:
+        membership = None
+        for analysis, key in keys:
+            for params, record in store.records(analysis, ref):
+                if all(params.get(name) == value for name, value in detection.items()):
+                    membership = record[key]
+                    break
+            if membership is not None:
+                break
+        if membership is None:
+            raise ValueError(f"no stored membership of {frame_name(ref)} with --method {method} in {store.path}; "
+                             f"run probability_calculation.py or frame_engine.py with --store first")
+        rows.append(membership)
+    return np.array(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Blocked standard errors, autocorrelation times and bootstrap intervals of the force, probability and interfacial affinity.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--store", help="SQLite file with the per-frame results of probability_calculation.py --store")
+    source.add_argument("--membership", help="bit-packed membership store written by membership_store.py")
+    parser.add_argument("--resamples", type=int, default=1000, help="number of bootstrap resamples")
+    parser.add_argument("--blocks", type=int, default=20, help="number of blocks for the blocked standard error")
+    parser.add_argument("--block-length", type=int, default=None, help="frames per bootstrap block (default: the autocorrelation time)")
+    parser.add_argument("--affinity", default=None, help="affinity of each monomer type, e.g. '1:1.75,2:2.25'; adds the interfacial affinity interval")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--method", choices=DETECTION_METHODS, default="dbscan", help="condensate detection of the stored membership records")
+    args = parser.parse_args()
+
+    # run directory (config_* files or trajectory cache) and directory with the outputs of force_calculation.py
+    directory = '/path/to/output_files/'
+    output_dir = '/path/to/directory/'
+
+    force = pd.read_csv(output_dir + 'force.dat').iloc[:, 1].to_numpy()
+    force_stats = summarize(force, args.blocks, args.resamples, args.block_length, seed=args.seed)
+    print(force_stats)
+    force_stats.to_csv(output_dir + 'force_statistics.csv', index=False)
+
+    if args.membership:
+        membership = MembershipStore(args.membership).membership(-3000)
+    else:
+        with ResultStore(args.store) as store:
+            membership = stored_membership(directory, store, method=args.method)
+    probability_stats = summarize(membership, args.blocks, args.resamples, args.block_length, seed=args.seed)
+    probability_stats.index.name = 'monomer'
+    probability_stats.to_csv(output_dir + 'probability_statistics.dat')
+
+    if args.affinity:
+        aff = affinity_vector('/path/to/directory/TypeID_hetero_I.dat', parse_affinity(args.affinity))
+        samples = affinity_bootstrap(membership, aff, args.resamples, probability_stats['block_length'].iloc[0], args.seed)
+        left, right, left_aff, right_aff = interfacial_affinities(membership.mean(axis=0)[None], aff)
+        low, high = confidence_interval(samples)
+        affinity_stats = pd.DataFrame({'interface': ['left', 'right'], 'affinity': [left_aff[0], right_aff[0]],
+                                       'se_bootstrap': np.nanstd(samples, axis=0, ddof=1), 'ci_low': low, 'ci_high': high,
+                                       'found_fraction': np.isfinite(samples).mean(axis=0)})
+        print(affinity_stats)
+        affinity_stats.to_csv(output_dir + 'affinity_statistics.csv', index=False)
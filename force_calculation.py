@@ -15,152 +15,40 @@ Created on Mon Feb  5 17:48:41 2024
 ###############################################################################################################################################################
 
 #imporing libraries
-import math
-import os 
+import argparse
+import os
+from functools import partial
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
-from sklearn.cluster import DBSCAN #clustering algorithm
-from natsort import natsorted #for sorting the files in directory
-from sklearn.neighbors import NearestNeighbors #for finding nearest neighbors 
-from scipy.signal import savgol_filter
-from scipy.signal import find_peaks
-
-#for DBSCAN, given parameter Min_points = 2 * dimension [sander et al. 1998]
-#calculate distance with 6th nearest neighbor given Min_points = 6
-def calculate_nearest_neighbors(i):
-    neighb = NearestNeighbors(n_neighbors=6)
-    nbrs = neighb.fit(i)
-    distances, indices = nbrs.kneighbors(i)
-    return distances, indices
-
-#arrange the distance between pairs in asending order
-#as rcut for attractive LJ-potential is 2.5 sigma, any particle pair which has distance more than rcut is not interacting so it is removed from calculating eps parameter
-def sort_and_filter_distances(distances, cutoff_value=2.5):
-    distances = np.sort(distances, axis=0)
-    distances = distances[:, 5]
-    distances = distances[distances <= cutoff_value]
-    return distances
-
-
-#as the k-distance curve has noise, point of maximum curvature can go to unreasonable values on the k-distance curve
-#here as a smoothing filter we are using savgol filter which fits a polynomial of given order to a given window of data points on the curve
-def smooth_data(distances):
-    x = range(len(distances))
-    smoothed_data = savgol_filter(distances, window_length=199, polyorder=3, mode='nearest')
-    return smoothed_data
-
-
-#the distance point on the curve for which the second derivative (curvature) is maximum (knee point) is treated as epsilon 
-def calculate_derivatives(smoothed_data):
-    x = range(len(smoothed_data))
-    slope = np.gradient(smoothed_data, x)
-    second_derivative = np.gradient(slope, x)
-    return slope, second_derivative
-
-def find_curvature_peaks(second_derivative):
-    peaks, _ = find_peaks(second_derivative)
-    return peaks
-
-def find_max_curvature_point(distances, second_derivative):
-    max_curvature_index = np.argmax(second_derivative)
-    max_curvature_point = distances[max_curvature_index]
-    return max_curvature_index, max_curvature_point
-
-
-
-#lists
-bond_length = [] #list for bond length for each configurations
-mean_bond_length = [] #list of mean bond lengths for all configurations 
-epsilon_list = []
-
-
-
-# assigning directory
-directory = '/path/to/output_files'
-
-for filename in natsorted(os.listdir(directory)):
-	f = os.path.join(directory, filename)
-
-	if os.path.isfile(f):
-          i = pd.read_csv(f, sep=" ", header=None, names=["index","x_pos", "y_pos", "z_pos", "type"])
-          print(f)
-          
-          i = i.drop(0, axis=0)
-          b = len(i) 
-          i = i.drop(b, axis=0)
-          i = i.drop('type', axis=1)
-          i = i.drop('index', axis=1)
-          
-          
-          distances, indices = calculate_nearest_neighbors(i)
-          filtered_distances = sort_and_filter_distances(distances)
-          smoothed_distances = smooth_data(filtered_distances)
-          slope, second_derivative = calculate_derivatives(smoothed_distances)
-          curvature_peaks = find_curvature_peaks(second_derivative)
-          max_curvature_index, max_curvature_point = find_max_curvature_point(filtered_distances, second_derivative)
-          epsilon = max_curvature_point
-          neighb = NearestNeighbors(n_neighbors=6)
-          nbrs=neighb.fit(i)
-          distances,indices=nbrs.kneighbors(i)
-          epsilon_list.append(epsilon)
-          
-          dbscan = DBSCAN(eps = epsilon, min_samples = 6).fit(i) # fitting the model
-          print(f'epsilon:{epsilon}')
-          labels = dbscan.labels_
-          x = i['x_pos'].astype(float)
-          y = i['y_pos'].astype(float)
-          z = i['z_pos'].astype(float)
-          
-          # Number of clusters in labels, ignoring noise if present.
-          n_clusters_ = len(set(labels)) - (1 if -1 in labels else 0)
-          n_noise_ = list(labels).count(-1)
-          df2 = pd.DataFrame()
-          particle_ID = list(range(0, b-1))
-          df2['particle_id'] = np.array(particle_ID)
-          df2['labels'] = np.array(labels)
-          df2['x_pos']= np.array(x)
-          df2['y_pos']= np.array(y)
-          df2['z_pos']= np.array(z)
-
-
-          #separating particles which are outside the cluster
-          df3 = df2[df2['labels'] == -1]
-          bond_ = []          
-          #saprate df for monomers outside the clusters
-          df4 = df3.query("0 <= particle_id < 500")
-          for i in df4['particle_id']:
-              for j in df4['particle_id']:
-                  if i == j + 1:
-                     
-                      x_i = df4.loc[df4['particle_id'] == i, 'x_pos'].iloc[0]
-                      y_i = df4.loc[df4['particle_id'] == i, 'y_pos'].iloc[0]
-                      z_i = df4.loc[df4['particle_id'] == i, 'z_pos'].iloc[0]
-            
-                      x_j = df4.loc[df4['particle_id'] == j, 'x_pos'].iloc[0]
-                      y_j = df4.loc[df4['particle_id'] == j, 'y_pos'].iloc[0]
-                      z_j = df4.loc[df4['particle_id'] == j, 'z_pos'].iloc[0]
-            
-                      diff_x = x_j - x_i
-                      diff_y = y_j - y_i
-                      diff_z = z_j - z_i
-            
-                      diff1_x = diff_x * diff_x
-                      diff1_y = diff_y * diff_y
-                      diff1_z = diff_z * diff_z    
-                      magnitude = math.sqrt(diff1_x + diff1_y + diff1_z)    
-                      bond_.append( magnitude)
-                      
-                      
-                      mean__ = np.mean(bond_)
-                     
-                      
-                      
-          print(len(bond_))           
-          mean_bond_length.append(mean__)            
-                      
-                      
-l = np.mean(mean_bond_length)        
+from trajectory_cache import frame_name
+from condensate_detection import detection_params, epsilon_schedule, add_epsilon_arguments #eps estimation and DBSCAN for each configuration
+from profiling import StageTimer, ProfileLog, add_profile_arguments
+from result_store import ResultStore, cached_frames
+from bond_forces import N_MONO, monomer_index, bare_bond_lengths, mean_bare_length, force_pn
+from accumulators import WindowAccumulator, Welford
+from frame_watcher import follow_results, add_follow_arguments
+from frame_engine import Consumer, read_frame #reading and clustering of a configuration
+
+
+#bond lengths of the monomer pairs which are both outside the cluster (NaN for the other bonds)
+#frame is a frame_engine.Frame with the DBSCAN labels of the configuration
+def frame_record(frame):
+    monomers = monomer_index(frame.ids)
+    lengths = bare_bond_lengths(frame.positions[monomers], frame.labels[monomers] == -1)
+    return {'epsilon': frame.epsilon, 'lengths': lengths}
+
+
+#work done for a single configuration, run in the worker processes when --workers > 1
+#with profile=True the stage timings of the frame are returned as well (None otherwise)
+#epsilon is given when eps is estimated per block or per run instead of per frame
+def process_frame(ref, profile=False, epsilon=None, method="dbscan"):
+    timer = StageTimer(enabled=profile)
+    frame = read_frame(ref, timer, epsilon=epsilon, method=method)
+    with timer.stage("bonds"):
+        record = frame_record(frame)
+    return record, (timer if profile else None)
+
 
 #average bond lengths calculated for the polymer in absence of proteins for different Re
 #average bond length for Re = 100 is 1.09055
@@ -176,33 +64,137 @@ l_0 = 1.09093 #mean bond length for Re=0.6
 K = 100
 
 
-delta_l = [item - l_0 for item in mean_bond_length]# for delta_length
-tension = [item * K for item in delta_l] #K = 100
-
-force = [] #converting in pN 
-
-for i in tension:
-             Fi = i*4.1/3.4
-             force.append(Fi)
-
-force = force[-3000:] #taking last 3000 values from each simulation
-
-print(np.mean(force)) 
-print(np.std(force))          
-
-#saving force in pN
-df8 = pd.DataFrame(force)
-df8.to_csv('/path/to/directory/force.dat')
-
-# Plot force vs time plot
-plt.figure(figsize=(12, 6))
-plt.plot(force, label="Force", color="Purple")
-plt.title("Force vs time (Conc: 84.5, Re: 0.6, Replicate: 1)")
-plt.xlabel("Time")
-plt.ylabel("Force")
-plt.grid(True)
-plt.savefig('/path/to/directory/homo_0.6_rep_1_force_vs_time.svg', format='svg')
-plt.close()
-
-
-
+#force time series, per-bond force profile and plot of the last 3000 configurations
+#title and plot_name label the run (sweep.py passes the values of every run of a sweep)
+def write_outputs(mean_bond_length, bond_length, epsilon_list, epsilon_mode, output_dir='/path/to/directory', l_0=l_0,
+                  title="Conc: 84.5, Re: 0.6, Replicate: 1", plot_name='homo_0.6_rep_1_force_vs_time.svg'):
+    force = list(force_pn(mean_bond_length.values(), l_0, K)) #tension K * (l - l_0) converted in pN, last 3000 values from each simulation
+
+    #force on every bond, averaged over the configurations of the same window in which the bond is bare
+    bond_force = force_pn(bond_length.values(), l_0, K)
+    bare_count = np.count_nonzero(~np.isnan(bond_force), axis=0)
+    bond_force_sum = np.nansum(bond_force, axis=0)
+    bond_profile = pd.DataFrame({'bond': np.arange(len(bare_count)),
+                                 'force': np.divide(bond_force_sum, bare_count, out=np.full(len(bare_count), np.nan), where=bare_count > 0),
+                                 'bare_fraction': bare_count / len(bond_force)})
+    bond_profile.to_csv(os.path.join(output_dir, 'bond_force_profile.dat'), index=False)
+
+    #mean and standard deviation of the force; the saved state can be merged with other replicates (accumulators.merge_saved)
+    force_stats = Welford().add_many(force)
+    print(force_stats.mean) 
+    print(force_stats.std())          
+    force_stats.save(os.path.join(output_dir, 'force_stats.npz'))
+
+    #eps used for each configuration of the window and how it was estimated
+    pd.DataFrame({'epsilon': epsilon_list.values(), 'mode': epsilon_mode}).to_csv(os.path.join(output_dir, 'epsilon.dat'))
+
+    #saving force in pN
+    df8 = pd.DataFrame(force)
+    df8.to_csv(os.path.join(output_dir, 'force.dat'))
+
+    # Plot force vs time plot
+    plt.figure(figsize=(12, 6))
+    plt.plot(force, label="Force", color="Purple")
+    plt.title(f"Force vs time ({title})")
+    plt.xlabel("Time")
+    plt.ylabel("Force")
+    plt.grid(True)
+    plt.savefig(os.path.join(output_dir, plot_name), format='svg')
+    plt.close()
+    return force_stats
+
+
+class ForceConsumer(Consumer):
+    """Force on the bare DNA over the last 3000 configurations, for analyse_run and frame_engine.run_engine."""
+    name = "force"
+
+    def __init__(self, output_dir='/path/to/directory', l_0=l_0, title="Conc: 84.5, Re: 0.6, Replicate: 1",
+                 plot_name='homo_0.6_rep_1_force_vs_time.svg', epsilon_mode="frame"):
+        self.outputs = partial(write_outputs, epsilon_mode=epsilon_mode, output_dir=output_dir, l_0=l_0, title=title, plot_name=plot_name)
+        #running windows over the last 3000 configurations, the memory does not grow with the number of frames
+        self.bond_length = WindowAccumulator(N_MONO - 1, window=3000) #bond lengths of each configuration (NaN for bonds inside the cluster)
+        self.mean_bond_length = WindowAccumulator(window=3000) #mean bond lengths of the configurations
+        self.epsilon_list = WindowAccumulator(window=3000)
+
+    def recorder(self):
+        return frame_record
+
+    def add(self, record):
+        epsilon, lengths = float(record['epsilon']), record['lengths']
+        print(f'epsilon:{epsilon}')
+        self.epsilon_list.add(epsilon)
+        print(np.count_nonzero(~np.isnan(lengths)))
+        self.bond_length.add(lengths)
+        mean__ = mean_bare_length(lengths)
+        #if no bond is outside the cluster, the mean of the previous configuration is carried over
+        if mean__ is None:
+            mean__ = self.mean_bond_length.last()
+        self.mean_bond_length.add(mean__)
+
+    def write(self):
+        return self.outputs(self.mean_bond_length, self.bond_length, self.epsilon_list)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Force on the bare DNA from the bond stretch outside the condensate.")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes used for the per-frame clustering")
+    add_profile_arguments(parser)
+    parser.add_argument("--store", help="SQLite file with per-frame results; only new or changed frames are analysed again")
+    add_follow_arguments(parser)
+    add_epsilon_arguments(parser)
+    return parser
+
+
+def analyse_run(directory, args, output_dir='/path/to/directory', l_0=l_0, title="Conc: 84.5, Re: 0.6, Replicate: 1",
+                plot_name='homo_0.6_rep_1_force_vs_time.svg'):
+    """
+    Force analysis of one run (config_* files, or a trajectory cache made with trajectory_cache.py) with the options in args (see build_parser).
+    Writes the outputs to output_dir and returns (Welford statistics of the force over the window, number of frames analysed).
+    """
+    profile = args.profile or bool(args.profile_log)
+    timings = StageTimer(enabled=profile)
+    log = ProfileLog(args.profile_log)
+    store = ResultStore(args.store) if args.store else None
+    #epsilon.dat records the eps mode, or the detection method if eps is not used
+    consumer = ForceConsumer(output_dir, l_0, title, plot_name, args.epsilon_mode if args.method == "dbscan" else args.method)
+
+    worker = partial(process_frame, profile=profile, method=args.method)
+    params = detection_params(args.method)
+    if args.follow:
+        block_size = args.epsilon_block if args.epsilon_mode == "block" and args.method == "dbscan" else None
+        results = follow_results(worker, directory, store, "force", params, args.poll, args.idle_timeout, block_size)
+    else:
+        schedule = None if args.method != "dbscan" else partial(epsilon_schedule, mode=args.epsilon_mode, block_size=args.epsilon_block,
+                           sample_size=args.epsilon_sample, workers=args.workers)
+        results = cached_frames(worker, directory, store, "force", params, workers=args.workers, schedule=schedule)
+
+    for ref, record, timer in results:
+        timings.merge(timer)
+        log.frame(frame_name(ref), timer)
+        print(frame_name(ref))
+        consumer.add(record)
+        #snapshot of the outputs while following a running simulation
+        if args.follow and consumer.mean_bond_length.total % args.snapshot_every == 0:
+            consumer.write()
+    if store is not None:
+        store.close()
+    if not consumer.mean_bond_length.total:
+        raise ValueError(f"No configuration files found in {directory}")
+
+    with timings.stage("write"):
+        force_stats = consumer.write()
+    wall = log.close(timings, consumer.mean_bond_length.total)
+    if profile:
+        print(timings.report(consumer.mean_bond_length.total, wall))
+    return force_stats, consumer.mean_bond_length.total
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.follow and args.epsilon_mode == "global" and args.method == "dbscan":
+        parser.error("--epsilon-mode global needs the whole run and cannot be used with --follow")
+
+    # assigning directory (config_* files, or a trajectory cache made with trajectory_cache.py)
+    directory = '/path/to/output_files'
+    analyse_run(directory, args)
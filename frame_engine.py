@@ -0,0 +1,168 @@
+###############################################################################################################################################################
+#Single pass analysis engine: every frame is read once and clustered once, and the frame is handed to several consumers.
+#A consumer computes a per-frame record from the frame (in the worker processes) and accumulates the records of the run (in the main process):
+#   force_calculation.ForceConsumer             bare bond lengths -> force time series and per-bond profile
+#   probability_calculation.ProbabilityConsumer  monomer membership -> probability profile
+#   kymograph.KymographConsumer                  z-histogram row -> kymograph
+#   partition_calculation.PartitionConsumer      proteins, monomers and volume of the clusters -> partition coefficient
+#   cluster_tracking.TrackingConsumer            labels by particle id -> cluster tracks, merge/split events
+#New per-frame observables are added by subclassing Consumer.
+#The records of all consumers of a frame are stored together in the result store, so a rerun only analyses new frames.
+###############################################################################################################################################################
+
+import argparse
+import os
+from collections import namedtuple
+from functools import partial
+from trajectory_cache import load_frame, frame_name, list_frame_refs
+from condensate_detection import cluster_frame, detection_params, epsilon_schedule, add_epsilon_arguments
+from profiling import StageTimer, ProfileLog, add_profile_arguments
+from result_store import ResultStore, cached_frames
+
+#one configuration as seen by the consumers; epsilon and labels are None if no consumer needs the clustering
+Frame = namedtuple("Frame", ["name", "ids", "positions", "types", "epsilon", "labels"])
+
+
+class Consumer:
+    """
+    Per-frame observable fed by run_engine.
+    recorder() returns a module level function (or functools.partial of one) frame -> dict of arrays, which is sent to the worker processes;
+    add(record) accumulates the record of every frame in frame order and write() saves the results of the run (and may return a summary of them).
+    """
+    name = "consumer"
+    needs_labels = True #False if the consumer does not use the DBSCAN labels
+
+    def prepare(self, frame):
+        """Called with the first frame of the run before the frames are analysed, e.g. to fix a bin grid."""
+
+    def params(self):
+        """Parameters the per-frame record depends on (JSON serialisable), part of the result store key."""
+        return {}
+
+    def recorder(self):
+        raise NotImplementedError
+
+    def add(self, record):
+        raise NotImplementedError
+
+    def write(self):
+        raise NotImplementedError
+
+
+def read_frame(ref, timer=None, needs_labels=True, epsilon=None, method="dbscan"):
+    """Read one frame and, if needs_labels, estimate eps (unless given) and compute the DBSCAN labels (or the grid labels, see method)."""
+    if timer is None:
+        timer = StageTimer(enabled=False)
+    with timer.stage("read"):
+        f, particle_ids, i, types = load_frame(ref)
+    if timer.enabled:
+        timer.count("particles", len(particle_ids))
+        timer.count("bytes", i.nbytes if isinstance(ref, tuple) else os.path.getsize(ref))
+    labels = None
+    if needs_labels:
+        epsilon, labels = cluster_frame(i, timer, epsilon, method, types)
+    return Frame(f, particle_ids, i, types, epsilon, labels)
+
+
+#work done for a single configuration, run in the worker processes when workers > 1
+#the record of consumer "force" with key "lengths" is stored as "force.lengths"
+def process_frame(ref, recorders, needs_labels=True, profile=False, epsilon=None, method="dbscan"):
+    timer = StageTimer(enabled=profile)
+    frame = read_frame(ref, timer, needs_labels, epsilon, method)
+    record = {}
+    for name, recorder in recorders:
+        with timer.stage(name):
+            for key, value in recorder(frame).items():
+                record[f"{name}.{key}"] = value
+    return record, (timer if profile else None)
+
+
+def consumer_record(record, name):
+    """Part of a fused frame record which belongs to the consumer name."""
+    prefix = name + "."
+    return {key[len(prefix):]: value for key, value in record.items() if key.startswith(prefix)}
+
+
+def run_engine(directory, consumers, workers=1, profile=False, store=None, epsilon_mode="frame", epsilon_block=100, epsilon_sample=20,
+               profile_log=None, method="dbscan"):
+    """
+    Analyse every frame of directory (config_* files or a trajectory cache) once and feed the consumers, then write their results.
+    method selects the condensate detection (condensate_detection.DETECTION_METHODS); eps is only estimated for DBSCAN.
+    With profile the stage timings and counters are printed, with profile_log they are also written as JSON lines (see profiling.ProfileLog).
+    Returns the number of frames analysed and a dict with what write() returned for every consumer name.
+    """
+    profile = profile or bool(profile_log)
+    log = ProfileLog(profile_log)
+    refs = list_frame_refs(directory)
+    if not refs:
+        raise ValueError(f"No configuration files found in {directory}")
+    needs_labels = any(c.needs_labels for c in consumers)
+    first = read_frame(refs[0], needs_labels=False)
+    for c in consumers:
+        c.prepare(first)
+
+    recorders = tuple((c.name, c.recorder()) for c in consumers)
+    analysis = "engine:" + ",".join(c.name for c in consumers)
+    params = dict(detection_params(method) if needs_labels else {}, **{c.name: c.params() for c in consumers})
+    worker = partial(process_frame, recorders=recorders, needs_labels=needs_labels, profile=profile, method=method)
+    schedule = None
+    if needs_labels and method == "dbscan":
+        schedule = partial(epsilon_schedule, mode=epsilon_mode, block_size=epsilon_block, sample_size=epsilon_sample, workers=workers)
+
+    timings = StageTimer(enabled=profile)
+    n_frames = 0
+    for ref, record, timer in cached_frames(worker, directory, store, analysis, params, workers=workers, schedule=schedule):
+        timings.merge(timer)
+        log.frame(frame_name(ref), timer)
+        print(frame_name(ref))
+        for c in consumers:
+            c.add(consumer_record(record, c.name))
+        n_frames += 1
+    outputs = {}
+    for c in consumers:
+        with timings.stage("write:" + c.name):
+            outputs[c.name] = c.write()
+    wall = log.close(timings, n_frames)
+    if profile:
+        print(timings.report(n_frames, wall))
+    return n_frames, outputs
+
+
+if __name__ == "__main__":
+    import force_calculation
+    import probability_calculation
+    import kymograph
+    import partition_calculation
+    import cluster_tracking
+
+    parser = argparse.ArgumentParser(description="Force, probability and kymograph of one run from a single pass over its frames.")
+    parser.add_argument("--analyses", default="force,probability,kymograph", help="comma separated list of the consumers (force, probability, kymograph, partition, tracking)")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes used for the per-frame work")
+    add_profile_arguments(parser)
+    parser.add_argument("--store", help="SQLite file with per-frame results; only new or changed frames are analysed again")
+    add_epsilon_arguments(parser)
+    args = parser.parse_args()
+
+    # assigning directory (config_* files, or a trajectory cache made with trajectory_cache.py) and output directory
+    directory = '/path/to/output_files/'
+    output_dir = '/path/to/directory'
+
+    #epsilon.dat records the eps mode, or the detection method if eps is not used
+    epsilon_mode = args.epsilon_mode if args.method == "dbscan" else args.method
+    available = {
+        "force": lambda: force_calculation.ForceConsumer(output_dir, epsilon_mode=epsilon_mode),
+        "probability": lambda: probability_calculation.ProbabilityConsumer(output_dir, epsilon_mode=epsilon_mode),
+        "kymograph": lambda: kymograph.KymographConsumer(os.path.join(output_dir, 'kymo_data_0.6_rep_0.npz'),
+                                                         os.path.join(output_dir, 'kymograph.svg')),
+        "partition": lambda: partition_calculation.PartitionConsumer(output_dir),
+        "tracking": lambda: cluster_tracking.TrackingConsumer(output_dir),
+    }
+    names = [a.strip() for a in args.analyses.split(",")]
+    unknown = set(names) - set(available)
+    if unknown:
+        parser.error(f"unknown analyses {sorted(unknown)}, expected some of {sorted(available)}")
+    store = ResultStore(args.store) if args.store else None
+    run_engine(directory, [available[name]() for name in names], args.workers, args.profile, store,
+               args.epsilon_mode, args.epsilon_block, args.epsilon_sample, args.profile_log, args.method)
+    if store is not None:
+        store.close()
@@ -0,0 +1,96 @@
+###############################################################################################################################################################
+#Follow mode: yield the configuration files of a running simulation as soon as ESPResSo has finished writing them.
+#The simulation scripts write every frame with `blockfile $f write particles {id pos type}` and close the file,
+#so a frame is complete once its particles block has been closed, i.e. the file ends with a line holding only "}".
+#The directory is polled; frames are yielded once each and in natsort order.
+#A binary trajectory (output_format "binary", see binary_trajectory.py) is followed by its number of complete frames instead,
+#and its frames are yielded as (directory, k) references.
+###############################################################################################################################################################
+
+import os
+import time
+from functools import partial
+from blockfile_reader import list_frames
+from binary_trajectory import is_binary_trajectory, BinaryTrajectory
+
+
+def is_complete(path):
+    """True if the blockfile has been written completely (last line is the closing brace of the particles block)."""
+    try:
+        with open(path, "rb") as fh:
+            fh.seek(0, os.SEEK_END)
+            size = fh.tell()
+            fh.seek(max(0, size - 64))
+            tail = fh.read()
+    except OSError:
+        return False
+    return tail.rstrip().endswith(b"\n}")
+
+
+def new_binary_frames(directory, n_seen):
+    """References (directory, k) of the frames of a binary trajectory after the first n_seen; a partly written frame is not counted."""
+    return [(directory, k) for k in range(n_seen, len(BinaryTrajectory(directory)))]
+
+
+def follow_frames(directory, poll_interval=10.0, idle_timeout=None):
+    """
+    Yield the path of every completed frame in directory, in natsort order, waiting for new ones
+    ((directory, k) references for a binary trajectory).
+    A frame that is still being written holds back the frames after it.
+    Stops after idle_timeout seconds without a new frame (never if idle_timeout is None).
+    """
+    #the simulation writes the frames in order, so the frames already yielded are the first n_seen ones
+    n_seen = 0
+    last_new = time.monotonic()
+    while True:
+        found = False
+        if is_binary_trajectory(directory):
+            for ref in new_binary_frames(directory, n_seen):
+                n_seen += 1
+                found = True
+                yield ref
+        else:
+            for f in list_frames(directory)[n_seen:]:
+                if not is_complete(f):
+                    break
+                n_seen += 1
+                found = True
+                yield f
+        if found:
+            last_new = time.monotonic()
+        elif idle_timeout is not None and time.monotonic() - last_new > idle_timeout:
+            return
+        else:
+            time.sleep(poll_interval)
+
+
+def follow_results(worker, directory, store, analysis, params, poll_interval=10.0, idle_timeout=None, block_size=None):
+    """
+    Follow-mode counterpart of result_store.cached_frames: yield (ref, record, timer) for every frame as it is completed.
+    With block_size, eps is estimated on the first frame of every block and passed to the worker (worker(ref, epsilon=eps))
+    for the other frames of the block. Records already in store (if one is given) are reused, new ones are added to it.
+    """
+    epsilon = None
+    for k, ref in enumerate(follow_frames(directory, poll_interval, idle_timeout)):
+        if block_size is None or k % block_size == 0:
+            epsilon, frame_params, frame_worker = None, params, worker
+        else:
+            frame_params, frame_worker = dict(params, epsilon=epsilon), partial(worker, epsilon=epsilon)
+        record = store.get(analysis, ref, frame_params) if store is not None else None
+        timer = None
+        if record is None:
+            record, timer = frame_worker(ref)
+            if store is not None:
+                store.put(analysis, ref, frame_params, record)
+                store.connection.commit()
+        if block_size is not None and k % block_size == 0:
+            epsilon = float(record['epsilon'])
+        yield ref, record, timer
+
+
+def add_follow_arguments(parser):
+    """Command line options of the follow mode, shared by the analysis scripts."""
+    parser.add_argument("--follow", action="store_true", help="analyse the frames while the simulation writes them")
+    parser.add_argument("--poll", type=float, default=10.0, help="seconds between two scans of the output directory in follow mode")
+    parser.add_argument("--idle-timeout", type=float, default=None, help="stop following after this many seconds without a new frame")
+    parser.add_argument("--snapshot-every", type=int, default=100, help="write the outputs every N frames in follow mode")
@@ -33,3 +33,39 @@ proc readData {filename} {
     }
     return $result
 }
+
+proc open_binary_trajectory {directory n_part} {
+# start a compact binary trajectory in directory, read by binary_trajectory.py
+# types.bin     : n_part and the number of the first frame (0) as int32, the particle ids 0 ... n_part-1 (int32) and their types (int8),
+#                 written once per run
+# positions.bin : one frame after the other, x y z of every particle as float32, all little endian
+# returns the channel of positions.bin for write_binary_frame
+file mkdir $directory
+set ids {}
+set types {}
+for {set i 0} {$i < $n_part} {incr i} {
+    lappend ids $i
+    lappend types [part $i print type]
+}
+set f [open "$directory/types.bin" "w"]
+fconfigure $f -translation binary
+puts -nonewline $f [binary format ii $n_part 0]
+puts -nonewline $f [binary format i* $ids]
+puts -nonewline $f [binary format c* $types]
+close $f
+set traj [open "$directory/positions.bin" "w"]
+fconfigure $traj -translation binary
+return $traj
+}
+
+proc write_binary_frame {traj n_part} {
+# append the positions of all particles as one float32 frame (12 bytes per particle) to the channel of open_binary_trajectory
+set pos {}
+for {set i 0} {$i < $n_part} {incr i} {
+    foreach x [part $i print pos] {
+        lappend pos $x
+    }
+}
+puts -nonewline $traj [binary format r* $pos]
+flush $traj
+}
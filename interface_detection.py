@@ -0,0 +1,134 @@
+#####################################################################################################################################################
+#Interface detection in the probability profiles of the monomers being inside the condensate (see interfacial_affinity_calculation.py).
+#Left interface: increasing window which starts at a probability <= 0.1, in which every value is larger than the mean of the values before it
+#in the window, and which ends once a value >= 0.99 is reached.
+#Right interface: decreasing window which starts at a probability >= 0.99, in which every value is smaller than the mean of the values before it,
+#and which ends once a value <= 0.1 is reached.
+#Both interfaces are found in one pass over the profile, with the window means kept as running sums; the windows are the same as those
+#of the original search, which recomputed the mean of the window at every step. find_interfaces_batch does the same for a
+#(profiles, monomers) matrix, one step per monomer for all profiles at once.
+#####################################################################################################################################################
+
+import numpy as np
+
+#the running mean and np.mean of the window can differ by rounding, at most by a few units in the last place of the sum of |values|;
+#a value closer than that to the running mean is compared with the mean as np.mean computes it (np.add.reduce / count), as in the original search
+_TIE_TOLERANCE = 4 * np.finfo(np.float64).eps
+
+
+def _window_mean(values, start, stop):
+    return np.add.reduce(values[start:stop]) / (stop - start)
+
+
+def find_interfaces(series, low_thresh=0.1, high_thresh=0.99, threshold=0.1):
+    """
+    Left and right interfaces of one probability profile (sequence or pandas Series indexed 0 ... n-1).
+    Returns (left windows, right windows), each a list of (start index, end index, probabilities of the window).
+    """
+    values = np.asarray(series, dtype=np.float64)
+    items = values.tolist()
+    left, right = [], []
+    left_start = right_start = None
+    left_sum = right_sum = left_abs = right_abs = 0.0
+    left_count = right_count = 0
+
+    for j, v in enumerate(items):
+        #left interface
+        restart = left_start is None
+        if not restart:
+            mean = left_sum / left_count
+            if abs(v - mean) < _TIE_TOLERANCE * left_abs:
+                mean = _window_mean(values, left_start, j)
+            if v > mean:
+                left_sum += v
+                left_abs += abs(v)
+                left_count += 1
+                if v >= high_thresh:
+                    left.append((left_start, j, list(values[left_start:j + 1])))
+                    left_start = None
+            else:
+                #the value which ends the window can start a new one
+                left_start = None
+                restart = True
+        if restart and v <= low_thresh:
+            left_start, left_sum, left_abs, left_count = j, v, abs(v), 1
+
+        #right interface
+        restart = right_start is None
+        if not restart:
+            mean = right_sum / right_count
+            if abs(v - mean) < _TIE_TOLERANCE * right_abs:
+                mean = _window_mean(values, right_start, j)
+            if v < mean:
+                right_sum += v
+                right_abs += abs(v)
+                right_count += 1
+                if v <= threshold:
+                    right.append((right_start, j, list(values[right_start:j + 1])))
+                    right_start = None
+                    restart = True
+            else:
+                right_start = None
+                restart = True
+        if restart and v >= 0.99:
+            right_start, right_sum, right_abs, right_count = j, v, abs(v), 1
+
+    return left, right
+
+
+def find_probability_windows(series, low_thresh=0.1, high_thresh=0.99):
+    """Increasing windows of the probability profile (left interfaces), see find_interfaces."""
+    return find_interfaces(series, low_thresh, high_thresh)[0]
+
+
+def find_reverse_probability_windows(series, window_size=5, threshold=0.1):
+    """Decreasing windows of the probability profile (right interfaces), see find_interfaces. window_size is not used."""
+    return find_interfaces(series, threshold=threshold)[1]
+
+
+def _batch_means(profiles, starts, sums, abs_sums, counts, active, values, j):
+    mean = np.divide(sums, counts, out=np.zeros_like(sums), where=active)
+    for p in np.flatnonzero(active & (np.abs(values - mean) < _TIE_TOLERANCE * abs_sums)):
+        mean[p] = _window_mean(profiles[p], starts[p], j)
+    return mean
+
+
+def find_interfaces_batch(profiles, low_thresh=0.1, high_thresh=0.99, threshold=0.1):
+    """
+    find_interfaces for every row of a (profiles, monomers) matrix, e.g. bootstrap resamples or all runs of a sweep.
+    Returns a list with (left windows, right windows) for every profile.
+    """
+    profiles = np.asarray(profiles, dtype=np.float64)
+    n_profiles, n = profiles.shape
+    results = [([], []) for _ in range(n_profiles)]
+    #state of the open left (index 0) and right (index 1) windows of every profile
+    active = np.zeros((2, n_profiles), dtype=bool)
+    starts = np.zeros((2, n_profiles), dtype=np.int64)
+    sums = np.zeros((2, n_profiles))
+    abs_sums = np.zeros((2, n_profiles))
+    counts = np.zeros((2, n_profiles), dtype=np.int64)
+
+    for j in range(n):
+        v = profiles[:, j]
+        for side in (0, 1):
+            was_active = active[side].copy()
+            mean = _batch_means(profiles, starts[side], sums[side], abs_sums[side], counts[side], was_active, v, j)
+            accept = was_active & ((v > mean) if side == 0 else (v < mean))
+            sums[side][accept] += v[accept]
+            abs_sums[side][accept] += np.abs(v[accept])
+            counts[side][accept] += 1
+            closed = accept & ((v >= high_thresh) if side == 0 else (v <= threshold))
+            for p in np.flatnonzero(closed):
+                results[p][side].append((int(starts[side][p]), j, list(profiles[p, starts[side][p]:j + 1])))
+            active[side] &= accept & ~closed
+            #a value which ends a window can start a new one (for the right interface also after a completed window)
+            restart = ~was_active | (was_active & ~accept)
+            if side == 1:
+                restart |= closed
+            begin = restart & ((v <= low_thresh) if side == 0 else (v >= 0.99))
+            active[side][begin] = True
+            starts[side][begin] = j
+            sums[side][begin] = v[begin]
+            abs_sums[side][begin] = np.abs(v[begin])
+            counts[side][begin] = 1
+    return results
@@ -4,13 +4,18 @@
 #Firstly, we identify the increasing trends (left interfaces) and decreasing trends (right interfaces) in the probability profile.
 #Next, we compute the average interfacial affinity based on the probability of monomers in the defined interface and their interaction strength with the proteins.
 #Finally, we plot the interfacial affinity along with probability and average interfacial affinity.
-####################################################################################################################################################
+#The affinity of every monomer is looked up once from the TypeID file; the weighted affinities of all profiles are computed with array indexing,
+#the probability files are processed in parallel and the results are written to one table. Plotting is optional (--plot).
+#####################################################################################################################################################
 
-import math
+import argparse
 import os
+from multiprocessing import Pool
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
+from interface_detection import find_interfaces_batch
+from bond_forces import N_MONO
 
 
 #affinity mapping as a string:
@@ -20,227 +25,162 @@ import pandas as pd
 affinity_str = "1:1.75,2:2.25" #for heterogeneous DNA I
 
 
-aff_map = {}
-for pair in affinity_str.split(","):
-    t, a = pair.split(":")
-    aff_map[int(t)] = float(a)
-
-
-aff_position = pd.read_csv(
-    "/path/to/directory/TypeID_hetero_I.dat",
-    sep=",", header=None,
-    names=["particle_id", "types"]
-)
-
-
-aff_position["particle_id"] = range(len(aff_position))
-
+def parse_affinity(affinity_str):
+    aff_map = {}
+    for pair in affinity_str.split(","):
+        t, a = pair.split(":")
+        aff_map[int(t)] = float(a)
+    return aff_map
 
-aff_position["aff"] = aff_position["types"].map(aff_map)
 
-print(aff_position.head())
+def affinity_vector(typeid_path, aff_map, n_mono=N_MONO):
+    """Affinity of every monomer (indexed by particle id) from a TypeID file (a '#' comment line, then 'id,type' rows)."""
+    type_ids = pd.read_csv(typeid_path, sep=",", header=None, names=["particle_id", "types"], comment="#")
+    types = np.full(n_mono, -1)
+    types[type_ids["particle_id"].to_numpy()] = type_ids["types"].to_numpy()
+    unknown = sorted(set(types.tolist()) - set(aff_map))
+    if unknown:
+        raise ValueError(f"no affinity given for the types {unknown} of {typeid_path}")
+    return np.array([aff_map[t] for t in types.tolist()])
 
 
-directory = '/path/to/directory/'
-
+def window_indices(windows_of_profiles):
+    """(profile, monomer) index arrays of all monomers in the windows; windows_of_profiles holds the window list of every profile."""
+    profile_index, monomer_index = [], []
+    for p, windows in enumerate(windows_of_profiles):
+        for start, end, window in windows:
+            profile_index.append(np.full(end - start + 1, p))
+            monomer_index.append(np.arange(start, end + 1))
+    if not profile_index:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return np.concatenate(profile_index), np.concatenate(monomer_index)
 
 
+def weighted_affinity(profiles, aff, windows_of_profiles):
+    """
+    Average interfacial affinity of every profile: sum(aff * probability) / sum(probability) over the monomers of all its windows.
+    NaN for a profile without windows.
+    """
+    profile_index, monomer_index = window_indices(windows_of_profiles)
+    probability = profiles[profile_index, monomer_index]
+    weighted = np.bincount(profile_index, weights=aff[monomer_index] * probability, minlength=len(profiles))
+    total = np.bincount(profile_index, weights=probability, minlength=len(profiles))
+    counts = np.bincount(profile_index, minlength=len(profiles))
+    return np.divide(weighted, total, out=np.full(len(profiles), np.nan), where=counts > 0)
 
 
-def find_probability_windows(series, low_thresh=0.1, high_thresh=0.99):
+def interfacial_affinities(profiles, aff):
     """
-    We find asending windows in the probability series indicating the left interface
-    first the window starts with probability 0.1 or less
-    Next, code checks if the probability of i is more than average of the probabilities of the previous windows
-    but less than 0.99.
-    Once probability is equal to or more than 0.99, break.
+    Interfaces and interfacial affinities of a (profiles, monomers) matrix.
+    Returns (left windows, right windows, left affinity, right affinity), the windows as one list per profile.
     """
-    windows = []
-    n = len(series)
-    i = 0
-
-    while i < n:
-        
-        if series[i] <= low_thresh:
-            start = i
-            current = series[i]
-            window = [current]
-            prev_vals = [current]
-
-            
-            while i + 1 < n:
-                avg_prev = np.mean(prev_vals)
-                next_val = series[i + 1]
-
-                if next_val > avg_prev:
-                    i += 1
-                    current = next_val
-                    window.append(current)
-                    prev_vals.append(current)
-                else:
-                    break
-
-                
-                if current >= high_thresh:
-                    windows.append((start, i, window))
-                    break
-        i += 1
-
-    return windows
-
-
-
-def find_reverse_probability_windows(series, window_size=5, threshold=0.1):
+    profiles = np.asarray(profiles, dtype=np.float64)
+    interfaces = find_interfaces_batch(profiles)
+    left = [l for l, r in interfaces]
+    right = [r for l, r in interfaces]
+    return left, right, weighted_affinity(profiles, aff, left), weighted_affinity(profiles, aff, right)
+
+
+def parse_name(filename):
+    #probability files are named <conc>_<...>_<replicate>.dat
+    parts = filename.split('_')
+    conc = parts[0]
+    replicate = parts[2].split('.')[0]
+    return conc, replicate
+
+
+def read_profile(file_path):
+    df = pd.read_csv(file_path, sep=",", header=0, names=['particle_id', 'probability'])
+    return df['probability'].to_numpy(dtype=np.float64)
+
+
+def analyse_files(item):
+    """Results table rows (and the windows, for plotting) of a chunk of probability files; run in the worker processes."""
+    paths, aff = item
+    profiles = np.array([read_profile(path) for path in paths])
+    left, right, left_aff, right_aff = interfacial_affinities(profiles, aff)
+    rows = []
+    for k, path in enumerate(paths):
+        conc, replicate = parse_name(os.path.basename(path))
+        rows.append({'file': os.path.basename(path), 'conc': conc, 'replicate': replicate,
+                     'n_left': len(left[k]), 'n_right': len(right[k]),
+                     'left_affinity': left_aff[k], 'right_affinity': right_aff[k],
+                     'mean_left_right_affinity': np.nanmean([left_aff[k], right_aff[k]]) if len(left[k]) + len(right[k]) else np.nan})
+    return rows, profiles, left, right
+
+
+def analyse_directory(directory, aff, workers=1, chunk=64):
     """
-    We find the decending windows in the probability series indicating the right interface of the condensate.
-    First, start with probability of more than or equal to 0.99.
-    To capture the decreasing trend, see if the next value is less than the average of the values present in the window.
-    Break when value is equal to or less than 0.1
+    Interfacial affinities of all probability files (*.dat) in directory, chunk files per task on workers processes.
+    Returns (results table, profiles, left windows, right windows), all in the order of the table.
     """
-    windows = []  
-    n = len(series)
-    i = 0
-
-    while i < n:
-        if series[i] >= 0.99:  
-            start = i  
-            current_value = series[i]
-            window = [current_value]
-            prev_values = [current_value]
-
-            while i + 1 < n:
-                avg_prev = np.mean(prev_values)
-                
-                if series[i + 1] < avg_prev:  
-                    prev_values.append(series[i + 1])
-                    window.append(series[i + 1])
-                    current_value = series[i + 1]
-                else:
-                    break
-
-                if current_value <= threshold:
-                    windows.append((start, i + 1, window))  
-                    break
-
-                i += 1  
-
-        i += 1  
-
-    return windows
-
-
-# Looping through each probability file in the directory
-for filename in os.listdir(directory):
-    if filename.endswith(".dat"):  # filtering for .dat files only
-        parts = filename.split('_')
-        conc = parts[0]  
-        replicate = parts[2].split('.')[0]  
-        
-        
-        file_path = os.path.join(directory, filename)
-        df = pd.read_csv(file_path, sep=",", header=0, names=['particle_id', 'probability'])
-        probability = df['probability']
-
-        
-        windows = find_probability_windows(probability)
-        print(windows)
-        
-        if windows:
-            # Create transition data
-            transition_data = []
-            for start_idx, end_idx, prob_window in windows:
-                particle_ids = list(range(start_idx, end_idx + 1))
-
-                df_window = pd.DataFrame({
-                    'particle_id': particle_ids,
-                    'probability': prob_window
-                })
-
-                df_window = df_window.merge(aff_position, on='particle_id', how='left')
-                transition_data.append(df_window)
-
-           
-            transition_df = pd.concat(transition_data, ignore_index=True)
-
-           
-            print(transition_df)
-
-           
-            transition_df['weighted_aff'] = transition_df['aff'] * transition_df['probability']
-            transition_df['average_interfacial_affinity'] = transition_df['weighted_aff'].sum() / transition_df['probability'].sum()
-
-            
-            name_transition = f"Conc = {conc}, Replicate = {replicate}, Average Affinity = {transition_df['average_interfacial_affinity'].iloc[0]}"
-
-            # Plotting the transition 0 to 1 (Affinity as bars and Probability as line)
-            fig, ax1 = plt.subplots(figsize=(10, 6), dpi=300)
-            ax1.bar(transition_df['particle_id'], transition_df['aff'], color='tab:blue', width=0.8)
-            ax1.set_xlabel('Particle ID', fontsize=21)
-            ax1.set_ylabel('Affinity', color='tab:blue', fontsize=21)
-            ax1.tick_params(axis='y', labelcolor='tab:blue', labelsize=16)
-
-            ax2 = ax1.twinx()
-            ax2.plot(transition_df['particle_id'], transition_df['probability'], color='black', linewidth=2, label='Probability')
-            ax2.set_ylabel('Probability', color='black', fontsize=21)
-            ax2.tick_params(axis='y', labelcolor='black', labelsize=16)
-
-            plt.title(f'Transition Plot (0 -> 1): Affinities (Bar) and Probabilities (Line)\n{name_transition}', fontsize=16)
-            ax1.grid(True)
-
-            
-            plt.savefig(f'/path/to/directory/{conc}_{replicate}_transition_plot_0_to_1.svg', format='svg')
-            plt.close()
-
+    paths = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".dat"))
+    items = [(paths[k:k + chunk], aff) for k in range(0, len(paths), chunk)]
+    if workers > 1 and len(items) > 1:
+        with Pool(processes=workers) as pool:
+            parts = pool.map(analyse_files, items)
+    else:
+        parts = [analyse_files(item) for item in items]
+    rows = [row for part in parts for row in part[0]]
+    profiles = [p for part in parts for p in part[1]]
+    left = [w for part in parts for w in part[2]]
+    right = [w for part in parts for w in part[3]]
+    return pd.DataFrame(rows), profiles, left, right
+
+
+def plot_transition(profile, aff, windows, title, output_path):
+    """Affinity (bars) and probability (line) of the monomers in the windows."""
+    particle_ids = np.concatenate([np.arange(start, end + 1) for start, end, window in windows])
+    fig, ax1 = plt.subplots(figsize=(10, 6), dpi=300)
+    ax1.bar(particle_ids, aff[particle_ids], color='tab:blue', width=0.8)
+    ax1.set_xlabel('Particle ID', fontsize=21)
+    ax1.set_ylabel('Affinity', color='tab:blue', fontsize=21)
+    ax1.tick_params(axis='y', labelcolor='tab:blue', labelsize=16)
+
+    ax2 = ax1.twinx()
+    ax2.plot(particle_ids, profile[particle_ids], color='black', linewidth=2, label='Probability')
+    ax2.set_ylabel('Probability', color='black', fontsize=21)
+    ax2.tick_params(axis='y', labelcolor='black', labelsize=16)
+
+    plt.title(title, fontsize=16)
+    ax1.grid(True)
+    plt.savefig(output_path, format='svg')
+    plt.close()
+
+
+def plot_results(results, profiles, left, right, aff, output_dir):
+    for k, row in results.iterrows():
+        conc, replicate = row['conc'], row['replicate']
+        # Plotting the transition 0 to 1 (Affinity as bars and Probability as line)
+        if left[k]:
+            name_transition = f"Conc = {conc}, Replicate = {replicate}, Average Affinity = {row['left_affinity']}"
+            plot_transition(profiles[k], aff, left[k], f'Transition Plot (0 -> 1): Affinities (Bar) and Probabilities (Line)\n{name_transition}',
+                            os.path.join(output_dir, f'{conc}_{replicate}_transition_plot_0_to_1.svg'))
         else:
-            print("No transition region found in the probability array.")
-
-        # Computing and plot the reverse transition (1 to 0)
-        reverse_windows = find_reverse_probability_windows(probability)
-
-        if reverse_windows:
-            reverse_transition_data = []
-            for start_idx, end_idx, prob_window in reverse_windows:
-                particle_ids = list(range(start_idx, end_idx + 1))
-
-                df_window = pd.DataFrame({
-                    'particle_id': particle_ids,
-                    'probability': prob_window
-                })
-
-                df_window = df_window.merge(aff_position, on='particle_id', how='left')
-                reverse_transition_data.append(df_window)
-
-            reverse_transition_df = pd.concat(reverse_transition_data, ignore_index=True)
-
-            
-            print(reverse_transition_df)
-
-            
-            reverse_transition_df['weighted_aff'] = reverse_transition_df['aff'] * reverse_transition_df['probability']
-            reverse_transition_df['average_interfacial_affinity'] = reverse_transition_df['weighted_aff'].sum() / reverse_transition_df['probability'].sum()
-
-            
-            name_reverse = f"Conc = {conc}, Replicate = {replicate}, Average Affinity = {reverse_transition_df['average_interfacial_affinity'].iloc[0]}"
-
-            # Plot the reverse transition 1 -> 0 (Affinity as bars and Probability as line)
-            fig, ax1 = plt.subplots(figsize=(10, 6), dpi=300)
-            ax1.bar(reverse_transition_df['particle_id'], reverse_transition_df['aff'], color='tab:blue', width=0.8)
-            ax1.set_xlabel('Particle ID', fontsize=21)
-            ax1.set_ylabel('Affinity', color='tab:blue', fontsize=21)
-            ax1.tick_params(axis='y', labelcolor='tab:blue', labelsize=16)
+            print(f"No transition region found in {row['file']}.")
+        # Plot the reverse transition 1 -> 0
+        if right[k]:
+            name_reverse = f"Conc = {conc}, Replicate = {replicate}, Average Affinity = {row['right_affinity']}"
+            plot_transition(profiles[k], aff, right[k], f'Reverse Transition Plot (1 -> 0): Affinities (Bar) and Probabilities (Line)\n{name_reverse}',
+                            os.path.join(output_dir, f'{conc}_{replicate}_reverse_transition_plot_1_to_0.svg'))
+        else:
+            print(f"No reverse transition region found in {row['file']}.")
 
-            ax2 = ax1.twinx()
-            ax2.plot(reverse_transition_df['particle_id'], reverse_transition_df['probability'], color='black', linewidth=2, label='Probability')
-            ax2.set_ylabel('Probability', color='black', fontsize=21)
-            ax2.tick_params(axis='y', labelcolor='black', labelsize=16)
 
-            plt.title(f'Reverse Transition Plot (1 -> 0): Affinities (Bar) and Probabilities (Line)\n{name_reverse}', fontsize=16)
-            ax1.grid(True)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Interfacial affinity of the condensate from the probability profiles.")
+    parser.add_argument("--affinity", default=affinity_str, help="affinity of each monomer type in kT, e.g. '2:2.00' or '1:1.75,2:2.25'")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes reading and analysing the probability files")
+    parser.add_argument("--plot", action="store_true", help="also plot the interfaces of every file")
+    args = parser.parse_args()
 
-            
-            plt.savefig(f'/path/to/directory/{conc}_{replicate}_reverse_transition_plot_1_to_0.svg', format='svg')
-            plt.close()
+    aff = affinity_vector("/path/to/directory/TypeID_hetero_I.dat", parse_affinity(args.affinity))
 
-        else:
-            print("No reverse transition region found in the probability array.")
+    # directory with the probability files, named <conc>_<...>_<replicate>.dat
+    directory = '/path/to/directory/'
 
+    results, profiles, left, right = analyse_directory(directory, aff, args.workers)
+    print(results)
+    results.to_csv('/path/to/directory/interfacial_affinity.csv', index=False)
+    if args.plot:
+        plot_results(results, profiles, left, right, aff, '/path/to/directory/')
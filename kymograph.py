@@ -1,104 +1,333 @@
 ################################################################################################################################################################################################
 #The code plots a kymograph of the simulation based on distribution of DNA and proteins on the longitudinal axis
-#To do this, the code first stores the position of all the particles on z-axis.
-#Next, after trimming the distribution based on position of first and last monomer, it counts the number of particles in each bin
-#where each bin is 2 sigma unit long.
+#The bin grid is fixed up front from the position of the first and last monomer (tethered ends), with bins 2 sigma unit long.
+#Next, the z-position of the particles of each frame is turned into bin indices and counted with one np.bincount,
+#separately for all particles, the DNA monomers and the proteins; only the counts (bins x frames) are kept in memory.
 #Plotting the kymograph and saving the data. 
 ################################################################################################################################################################################################
 
+import argparse
 import os
+from functools import partial
 import numpy as np
-import pandas as pd
-from natsort import natsorted
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
+from trajectory_cache import load_frame, frame_name, list_frame_refs
+from result_store import ResultStore, cached_frames
+from frame_watcher import follow_frames, add_follow_arguments
+from frame_engine import Consumer
+
+# channels of the kymograph: all particles, DNA monomers (type IDs 0-10 of the TypeID files) and proteins (type 24)
+CHANNELS = ("all", "dna", "protein")
+DNA_TYPES = (0, 10)
+PROTEIN_TYPE = 24
+
+def tethered_ends(particle_ids, positions):
+    # z-position of the first (left tethered end) and last monomer (right tethered end)
+    return positions[particle_ids == 0, 2][0], positions[particle_ids == 499, 2][0]
+
+def bin_indices(z, bins):
+    """Bin of every z value, -1 outside the grid; the same convention as np.histogram (the last bin includes its right edge)."""
+    index = np.searchsorted(bins, z, side='right') - 1
+    index[z == bins[-1]] = len(bins) - 2
+    index[(z < bins[0]) | (z > bins[-1])] = -1
+    return index
+
+def channel_counts(z, types, bins):
+    """(len(CHANNELS), bins) particle counts of one frame, from one np.bincount over the precomputed bin indices."""
+    n_bins = len(bins) - 1
+    index = bin_indices(z, bins)
+    channel = np.full(len(z), -1)
+    channel[(types >= DNA_TYPES[0]) & (types <= DNA_TYPES[1])] = 1
+    channel[types == PROTEIN_TYPE] = 2
+    inside = index >= 0
+    typed = inside & (channel > 0)
+    keys = np.concatenate([index[inside], channel[typed] * n_bins + index[typed]])
+    return np.bincount(keys, minlength=len(CHANNELS) * n_bins).reshape(len(CHANNELS), n_bins)
 
 def process_configurations(directory, output_path):
-    all_z_positions = []
-    particle0_z = []  # For the first monomer position (left tethered end)
-    particle499_z = []  # For the position of last monomer (right tethered end)
-
-    # Processing each configuration file
-    for filename in natsorted(os.listdir(directory)):
-        f = os.path.join(directory, filename)
-        print(f"Processing: {filename}")
-        if os.path.isfile(f):
-            try:
-                
-                df = pd.read_csv(f, sep=" ", header=None, 
-                               names=["particle_id", "x_pos", "y_pos", "z_pos", "type"])
-                df = df.drop([0, len(df)-1])  
-                
-                
-                for col in df.columns:
-                    df[col] = df[col].astype(str).str.replace(r'[\{\}\t]', '', regex=True)
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                df = df.dropna()
-                
-                
-                df = df.sort_values('particle_id')
-                z_pos = df['z_pos'].values
-                
-                all_z_positions.append(z_pos)
-                
-                
-                particle0_z.append(df[df['particle_id'] == 0]['z_pos'].values[0])
-                particle499_z.append(df[df['particle_id'] == 499]['z_pos'].values[0])
-                
-            except Exception as e:
-                print(f"Error processing {filename}: {str(e)}")
-                continue
-
-    if not all_z_positions:
+    refs = list_frame_refs(directory)
+    if not refs:
         raise ValueError("No valid configuration files found in the directory")
 
-    z_matrix = np.array(all_z_positions).T
-    
+    # the ends of the polymer are tethered, so the bin grid is fixed up front from the first frame
+    f, particle_ids, positions, types = load_frame(refs[0])
+    z_min, z_max, bins = kymograph_bins(*tethered_ends(particle_ids, positions))
+
+    # only the counts are kept: frames x channels x bins instead of frames x particles
+    counts = np.zeros((len(refs), len(CHANNELS), len(bins) - 1), dtype=np.int32)
+    n_particles = np.zeros(len(refs))
+    for t, ref in enumerate(refs):
+        try:
+            f, particle_ids, positions, types = load_frame(ref)
+            print(f"Processing: {os.path.basename(f)}")
+            counts[t] = channel_counts(positions[:, 2], types, bins)
+            n_particles[t] = len(positions)
+        except Exception as e:
+            print(f"Error processing {frame_name(ref)}: {str(e)}")
+            continue
+
+    valid = n_particles > 0
+    if not valid.any():
+        raise ValueError("No valid configuration files found in the directory")
+    save_kymograph(output_path, counts[valid] / n_particles[valid, None, None], bins, z_min, z_max)
+
+def kymograph_bins(particle0_z, particle499_z):
     # computiong the z-axis range with padding of ±2 around the first and last monomer
-    z_min = min(particle0_z) - 2  #first monomer position - 2
-    z_max = max(particle499_z) + 2  # last monomer position + 2
+    z_min = np.min(particle0_z) - 2  #first monomer position - 2
+    z_max = np.max(particle499_z) + 2  # last monomer position + 2
     
     # setting bin width = 2 sigma
     bin_width = 2
     bins = np.arange(z_min, z_max + bin_width, bin_width)
+    return z_min, z_max, bins
 
-    
-    counts_matrix = np.array([np.histogram(z_matrix[:, t], bins=bins)[0] 
-                           for t in range(z_matrix.shape[1])])
-    normalized_counts = counts_matrix / z_matrix.shape[0]
+# keys of the channels in the saved data
+CHANNEL_KEYS = {"all": "normalized_counts", "dna": "dna_counts", "protein": "protein_counts"}
+# the pyramid levels halve the number of frames until fewer than PYRAMID_MIN_ROWS rows are left
+PYRAMID_MIN_ROWS = 256
+
+def downsample(counts, time_factor=1, space_factor=1):
+    """Mean of counts (frames x bins) over blocks of time_factor frames and space_factor bins; the last block of each axis may be shorter."""
+    for axis, factor in ((0, time_factor), (1, space_factor)):
+        if factor > 1:
+            starts = np.arange(0, counts.shape[axis], factor)
+            sizes = np.diff(np.append(starts, counts.shape[axis]))
+            counts = np.add.reduceat(counts, starts, axis=axis) / np.expand_dims(sizes, 1 - axis)
+    return counts
+
+def kymograph_pyramid(counts):
+    """Levels 1, 2, ... of counts, level k holding the mean over blocks of 2**k frames (float32, they are only plotted)."""
+    levels = []
+    while len(counts) > PYRAMID_MIN_ROWS:
+        counts = downsample(counts, time_factor=2)
+        levels.append(counts.astype(np.float32))
+    return levels
+
+class PyramidFiles:
+    """
+    The levels of kymograph_pyramid built one row at a time, for follow mode: level k is kept in the file path_level_<k> (float32).
+    Row j of level k is the mean of rows 2j and 2j+1 of level k-1 and is written once both are known; only the unpaired row of
+    every level is kept in memory, so the memory used does not grow with the number of rows.
+    """
+
+    def __init__(self, path, row_shape):
+        self.path = path
+        self.row_shape = tuple(row_shape)
+        self.n_rows = 0
+        self.pending = [] #pending[k]: row of level k (float64) waiting for the next one to be paired, or None
+        self.complete = [] #complete[k]: number of rows of level k + 1 which are final
+        self.files = [] #files[k]: file of level k + 1
+
+    def level_path(self, k):
+        return f"{self.path}_level_{k}"
+
+    def write_row(self, k, j, row):
+        fh = self.files[k]
+        fh.seek(j * int(np.prod(self.row_shape)) * 4)
+        fh.write(np.asarray(row, dtype=np.float32).tobytes())
+
+    def add(self, row):
+        carry = np.asarray(row, dtype=np.float64)
+        self.n_rows += 1
+        k = 0
+        while True:
+            if k == len(self.pending):
+                self.pending.append(None)
+                self.complete.append(0)
+                self.files.append(open(self.level_path(k + 1), 'w+b'))
+            if self.pending[k] is None:
+                self.pending[k] = carry
+                return
+            carry = (self.pending[k] + carry) / 2
+            self.pending[k] = None
+            self.write_row(k, self.complete[k], carry)
+            self.complete[k] += 1
+            k += 1
+
+    def levels(self):
+        """Levels 1, 2, ... of the rows added so far as memory maps, equal to kymograph_pyramid of all rows."""
+        levels = []
+        n = self.n_rows
+        tail = None #last row of level k which is not final yet (its block of rows is incomplete)
+        k = 0
+        while n > PYRAMID_MIN_ROWS:
+            pending = self.pending[k]
+            if pending is not None:
+                tail = pending if tail is None else (pending + tail) / 2
+            n = (n + 1) // 2
+            if tail is not None:
+                #written after the final rows, and overwritten by the final row once its block is complete
+                self.write_row(k, self.complete[k], tail)
+            self.files[k].flush()
+            levels.append(np.memmap(self.level_path(k + 1), dtype=np.float32, mode='r', shape=(n,) + self.row_shape))
+            k += 1
+        return levels
 
+    def close(self):
+        for fh in self.files:
+            fh.close()
+
+def save_kymograph(output_path, channel_counts, bins, z_min, z_max, levels=None):
+    """
+    channel_counts: normalized frames x CHANNELS x bins counts; the all-particle channel is stored as normalized_counts.
+    Every channel is stored together with its time-downsampled levels (e.g. normalized_counts_level_1) for plotting long runs.
+    levels are the levels 1, 2, ... of channel_counts (levels x CHANNELS x bins each, see PyramidFiles); computed if not given.
+    """
+    channels = {}
+    for c, channel in enumerate(CHANNELS):
+        key = CHANNEL_KEYS[channel]
+        channels[key] = channel_counts[:, c]
+        channel_levels = kymograph_pyramid(channel_counts[:, c]) if levels is None else [level[:, c] for level in levels]
+        for k, level in enumerate(channel_levels, start=1):
+            channels[f"{key}_level_{k}"] = level
     np.savez(output_path,
-             normalized_counts=normalized_counts,
+             **channels,
+             n_frames=len(channel_counts),
              bins=bins,
              xlim_min=z_min,
              xlim_max=z_max,
              y_ticks=[0, 2000, 4000, 6000, 8000, 10000],
              y_labels=['0', '1', '2', '3', '4', '5'])
 
-def plot_kymograph(input_path, output_plot_path):
-    """Generate kymograph plot from saved data"""
+def stored_rows(data, name):
+    """Number of rows of the array name of an opened .npz file, read from the array header without loading the array."""
+    with data.zip.open(name + '.npy') as fh:
+        version = np.lib.format.read_magic(fh)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(fh)
+    return shape[0]
+
+def pick_level(data, key, rows):
+    """Coarsest stored level of channel key which still has at least rows rows (the full data if none has); only that level is loaded."""
+    name = key
+    k = 1
+    while f"{key}_level_{k}" in data.files and stored_rows(data, f"{key}_level_{k}") >= rows:
+        name = f"{key}_level_{k}"
+        k += 1
+    return data[name]
+
+# per-frame record for the result store: the channel counts for a given bin grid
+def frame_counts(ref, bins):
+    f, particle_ids, positions, types = load_frame(ref)
+    return {'counts': channel_counts(positions[:, 2], types, bins), 'n_particles': len(positions)}, None
+
+def process_configurations_cached(directory, output_path, store):
+    """Same output as process_configurations, but the per-frame channel counts are kept in a ResultStore"""
+    refs = list_frame_refs(directory)
+    if not refs:
+        raise ValueError("No valid configuration files found in the directory")
+    f, particle_ids, positions, types = load_frame(refs[0])
+    z_min, z_max, bins = kymograph_bins(*tethered_ends(particle_ids, positions))
+
+    params = {"z_min": float(z_min), "z_max": float(z_max), "bin_width": 2, "channels": list(CHANNELS)}
+    rows = [record['counts'] / record['n_particles']
+            for ref, record, timer in cached_frames(partial(frame_counts, bins=bins), directory, store, "kymograph_counts", params)]
+    save_kymograph(output_path, np.array(rows), bins, z_min, z_max)
+
+def frame_row(frame, bins):
+    return {'counts': channel_counts(frame.positions[:, 2], frame.types, bins), 'n_particles': len(frame.positions)}
+
+class KymographConsumer(Consumer):
+    """Kymograph rows for frame_engine.run_engine; like process_configurations, the bin grid is fixed by the tethered ends in the first frame."""
+    name = "kymograph"
+    needs_labels = False
+
+    def __init__(self, output_path, plot_path=None):
+        self.output_path = output_path
+        self.plot_path = plot_path
+        self.rows = []
+
+    def prepare(self, frame):
+        self.z_min, self.z_max, self.bins = kymograph_bins(*tethered_ends(frame.ids, frame.positions))
+
+    def params(self):
+        return {"z_min": float(self.z_min), "z_max": float(self.z_max), "bin_width": 2, "channels": list(CHANNELS)}
+
+    def recorder(self):
+        return partial(frame_row, bins=self.bins)
+
+    def add(self, record):
+        self.rows.append(record['counts'] / record['n_particles'])
+
+    def write(self):
+        save_kymograph(self.output_path, np.array(self.rows), self.bins, self.z_min, self.z_max)
+        if self.plot_path is not None:
+            plot_kymograph(self.output_path, self.plot_path)
+        return len(self.rows)
+
+def follow_configurations(directory, output_path, poll_interval=10.0, idle_timeout=None, snapshot_every=100):
+    """
+    Follow mode: histogram the frames while the simulation writes them and save the kymograph every snapshot_every frames.
+    The bin grid is fixed by the tethered ends in the first frame; the channel counts are appended to output_path + '.rows'
+    on disk and the pyramid levels are extended frame by frame (PyramidFiles), so the memory used does not grow with the number of frames.
+    """
+    rows_path = output_path + '.rows'
+    bins = None
+    pyramid = None
+    n_frames = 0
+    try:
+        with open(rows_path, 'wb') as rows:
+            for ref in follow_frames(directory, poll_interval, idle_timeout):
+                f, particle_ids, positions, types = load_frame(ref)
+                print(f"Processing: {os.path.basename(f)}")
+                if bins is None:
+                    z_min, z_max, bins = kymograph_bins(*tethered_ends(particle_ids, positions))
+                    pyramid = PyramidFiles(rows_path, (len(CHANNELS), len(bins) - 1))
+                counts = channel_counts(positions[:, 2], types, bins) / len(positions)
+                rows.write(counts.astype(np.float64).tobytes())
+                pyramid.add(counts)
+                n_frames += 1
+                if n_frames % snapshot_every == 0:
+                    rows.flush()
+                    save_followed(output_path, rows_path, pyramid, bins, z_min, z_max)
+        if not n_frames:
+            raise ValueError("No valid configuration files found in the directory")
+        save_followed(output_path, rows_path, pyramid, bins, z_min, z_max)
+    finally:
+        if pyramid is not None:
+            pyramid.close()
+
+def save_followed(output_path, rows_path, pyramid, bins, z_min, z_max):
+    """save_kymograph of the rows file and pyramid of follow mode, both memory-mapped."""
+    counts = np.memmap(rows_path, dtype=np.float64, mode='r', shape=(pyramid.n_rows,) + pyramid.row_shape)
+    save_kymograph(output_path, counts, bins, z_min, z_max, pyramid.levels())
+
+def plot_kymograph(input_path, output_plot_path, channel="all", dpi=600):
+    """
+    Generate kymograph plot from saved data, for all particles or only the "dna" or "protein" channel.
+    The colour scale is 0-0.03 for all particles and 0 to the largest value of the plotted data for a single channel.
+    The stored level with about as many rows as the plot has pixels is drawn; the format follows the file extension (svg, png, ...).
+    """
     data = np.load(input_path)
-    normalized_counts = data['normalized_counts']
     bins = data['bins']
     xlim_min = data['xlim_min']
     xlim_max = data['xlim_max']
+    key = CHANNEL_KEYS[channel]
+    n_frames = int(data['n_frames']) if 'n_frames' in data.files else stored_rows(data, key)
 
-    fig, ax = plt.subplots(figsize=(10, 6), dpi=600)
-    
+    fig, ax = plt.subplots(figsize=(10, 6), dpi=dpi)
+    normalized_counts = pick_level(data, key, int(np.ceil(ax.get_window_extent().height)))
     
     cax = ax.imshow(normalized_counts, 
                     cmap='gray', 
                     aspect='auto', 
                     origin='lower',
-                    extent=[bins[0], bins[-1], 0, len(normalized_counts)],
+                    extent=[bins[0], bins[-1], 0, n_frames],
                     interpolation='nearest')
 
    
-    cbar = fig.colorbar(cax)
-    cbar.set_ticks([0, 0.01, 0.02, 0.03])
+    # the DNA and protein channels are fractions of all particles too, so they are scaled to their own maximum instead of 0.03
+    if channel == "all":
+        vmax, ticks, tick_format = 0.03, [0, 0.01, 0.02, 0.03], None
+    else:
+        vmax = float(normalized_counts.max()) or 0.03
+        ticks, tick_format = np.linspace(0, vmax, 4), "%.2g"
+    cbar = fig.colorbar(cax, format=tick_format)
+    cbar.set_ticks(ticks)
     cbar.ax.tick_params(labelsize=25)
     cbar.set_label('Normalized frequency', fontsize=25)
-    cax.set_clim(0.0, 0.03)
+    cax.set_clim(0.0, vmax)
 
     
     ax.set_yticks(data['y_ticks'])
@@ -114,15 +343,31 @@ def plot_kymograph(input_path, output_plot_path):
     ax.set_xticks([])
 
     
-    fig.savefig(output_plot_path, format="svg", bbox_inches='tight', dpi=600)
+    output_format = os.path.splitext(output_plot_path)[1][1:] or "svg"
+    fig.savefig(output_plot_path, format=output_format, bbox_inches='tight', dpi=dpi)
     plt.close()  
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kymograph of the particle distribution along the z-axis.")
+    parser.add_argument("--store", help="SQLite file with per-frame results; only new or changed frames are read again")
+    parser.add_argument("--channel", choices=CHANNELS, default="all", help="particles shown in the plot: all, DNA monomers or proteins")
+    parser.add_argument("--raster", action="store_true", help="save the plot as png instead of svg")
+    parser.add_argument("--dpi", type=int, default=600, help="resolution of the plot; the stored level matching it is drawn")
+    add_follow_arguments(parser)
+    args = parser.parse_args()
     
     config_dir = '/path/to/output_files/'
     analysis_output = '/path/to/directory/kymo_data_0.6_rep_0.npz'
-    process_configurations(config_dir, analysis_output)
+    if args.follow:
+        follow_configurations(config_dir, analysis_output, args.poll, args.idle_timeout, args.snapshot_every)
+    elif args.store:
+        with ResultStore(args.store) as store:
+            process_configurations_cached(config_dir, analysis_output, store)
+    else:
+        process_configurations(config_dir, analysis_output)
     
     
     plot_output = '/path/to/directory/kymograph.svg'
-    plot_kymograph(analysis_output, plot_output)
+    if args.raster:
+        plot_output = os.path.splitext(plot_output)[0] + '.png'
+    plot_kymograph(analysis_output, plot_output, args.channel, args.dpi)
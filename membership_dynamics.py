@@ -0,0 +1,122 @@
+###############################################################################################################################################################
+#Exchange kinetics of the monomers between the condensate and the bare DNA, from the per-frame membership (see membership_store.py).
+#Run-length encoding of the (frames, monomers) 0/1 matrix gives every stay of a monomer inside (or outside) the condensate:
+#   dwell times   : length of every run in frames; runs touching the first or last frame are censored (their true length is unknown)
+#   entry / exit  : number of 0 -> 1 and 1 -> 0 changes of every monomer, and the rates per frame spent outside / inside
+#   interfaces    : first and last monomer inside the condensate and the number of boundaries along the chain in every frame
+#Everything is computed with whole-array operations, in time linear in frames x monomers.
+#Usage: python membership_dynamics.py /path/to/run.membership [--frames 3000] [--typeid TypeID_hetero_I.dat]
+###############################################################################################################################################################
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from membership_store import MembershipStore
+
+
+def runs(membership, value=1):
+    """
+    All runs of value along the frames of every monomer of a (frames, monomers) matrix.
+    Returns (monomer, first frame, length, censored) arrays, ordered by monomer and frame.
+    """
+    state = (np.asarray(membership) == value).T.astype(np.int8)
+    n_mono, n = state.shape
+    padded = np.zeros((n_mono, n + 2), dtype=np.int8)
+    padded[:, 1:-1] = state
+    change = np.diff(padded, axis=1)
+    #np.nonzero returns the changes in row-major order, so the k-th start and the k-th end belong to the same run
+    monomer, start = np.nonzero(change == 1)
+    end = np.nonzero(change == -1)[1]
+    length = end - start
+    censored = (start == 0) | (end == n)
+    return monomer, start, length, censored
+
+
+def dwell_times(membership):
+    """Table of every stay inside (state 1) and outside (state 0) the condensate."""
+    tables = []
+    for value in (1, 0):
+        monomer, start, length, censored = runs(membership, value)
+        tables.append(pd.DataFrame({'monomer': monomer, 'state': value, 'start': start, 'length': length, 'censored': censored}))
+    return pd.concat(tables, ignore_index=True)
+
+
+def dwell_histogram(membership, value=1, include_censored=False):
+    """(monomers, frames + 1) matrix: entry [m, l] is the number of runs of length l of monomer m."""
+    membership = np.asarray(membership)
+    n, n_mono = membership.shape
+    monomer, start, length, censored = runs(membership, value)
+    keep = include_censored | ~censored
+    return np.bincount(monomer[keep] * (n + 1) + length[keep], minlength=n_mono * (n + 1)).reshape(n_mono, n + 1)
+
+
+def transitions(membership):
+    """Number of entries (0 -> 1) and exits (1 -> 0) of every monomer."""
+    change = np.diff(np.asarray(membership, dtype=np.int8), axis=0)
+    return (change == 1).sum(axis=0), (change == -1).sum(axis=0)
+
+
+def monomer_kinetics(membership, frame_interval=1.0):
+    """
+    Per-monomer probability, entries, exits, rates and mean dwell times (in units of frame_interval).
+    The entry rate is the number of entries per time spent outside, the exit rate the number of exits per time spent inside;
+    the mean dwell times only use complete (uncensored) runs and are NaN if a monomer has none.
+    """
+    membership = np.asarray(membership, dtype=np.int8)
+    n, n_mono = membership.shape
+    entries, exits = transitions(membership)
+    inside = membership.sum(axis=0, dtype=np.int64)
+    #frames at risk of a change: all frames but the last one
+    at_risk_inside = inside - membership[-1]
+    at_risk_outside = (n - inside) - (1 - membership[-1])
+    table = pd.DataFrame({'monomer': np.arange(n_mono), 'probability': inside / n, 'entries': entries, 'exits': exits})
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table['entry_rate'] = entries / (at_risk_outside * frame_interval)
+        table['exit_rate'] = exits / (at_risk_inside * frame_interval)
+        for value, name in ((1, 'mean_dwell_inside'), (0, 'mean_dwell_outside')):
+            monomer, start, length, censored = runs(membership, value)
+            complete = ~censored
+            total = np.bincount(monomer[complete], weights=length[complete], minlength=n_mono)
+            count = np.bincount(monomer[complete], minlength=n_mono)
+            table[name] = total / count * frame_interval
+    return table
+
+
+def interface_positions(membership):
+    """
+    First and last monomer inside the condensate (-1 if none) and the number of inside/outside boundaries along the chain, for every frame.
+    """
+    membership = np.asarray(membership, dtype=np.int8)
+    any_inside = membership.any(axis=1)
+    left = np.where(any_inside, membership.argmax(axis=1), -1)
+    right = np.where(any_inside, membership.shape[1] - 1 - membership[:, ::-1].argmax(axis=1), -1)
+    boundaries = np.count_nonzero(np.diff(membership, axis=1), axis=1)
+    return pd.DataFrame({'left': left, 'right': right, 'n_boundaries': boundaries})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Residence times, entry/exit rates and interface positions from a membership store.")
+    parser.add_argument("membership", help="bit-packed membership store written by membership_store.py")
+    parser.add_argument("--frames", type=int, default=None, help="use only the last N frames (default: all)")
+    parser.add_argument("--frame-interval", type=float, default=1.0, help="time between two saved frames, for the rates and dwell times")
+    parser.add_argument("--typeid", default=None, help="TypeID file; adds the type of every monomer to the kinetics table")
+    args = parser.parse_args()
+
+    output_dir = '/path/to/directory/'
+
+    store = MembershipStore(args.membership)
+    start = -args.frames if args.frames else 0
+    membership = store.membership(start)
+
+    kinetics = monomer_kinetics(membership, args.frame_interval)
+    if args.typeid:
+        types = pd.read_csv(args.typeid, sep=",", header=None, names=["particle_id", "types"], comment="#")
+        kinetics = kinetics.merge(types, left_on='monomer', right_on='particle_id', how='left').drop(columns='particle_id')
+        print(kinetics.groupby('types')[['probability', 'entry_rate', 'exit_rate', 'mean_dwell_inside', 'mean_dwell_outside']].mean())
+    kinetics.to_csv(os.path.join(output_dir, 'monomer_kinetics.dat'), index=False)
+    dwell_times(membership).to_csv(os.path.join(output_dir, 'dwell_times.csv'), index=False)
+
+    interfaces = interface_positions(membership)
+    interfaces.insert(0, 'filename', store.filenames[start:] if start else store.filenames)
+    interfaces.to_csv(os.path.join(output_dir, 'interface_positions.dat'), index=False)
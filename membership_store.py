@@ -0,0 +1,160 @@
+###############################################################################################################################################################
+#Bit-packed store of the condensate membership of the monomers (1 if the monomer is part of a cluster, 0 if not), one row per frame.
+#A store is a directory containing:
+#   membership.bits : (frames, ceil(n_mono / 8)) bytes, np.packbits of every membership row, read back as a np.memmap
+#   index.csv       : file name and eps of every frame
+#   meta.json       : number of monomers
+#500 monomers take 63 bytes per frame, so the membership of a whole run stays small and every later analysis (probability, interfaces,
+#residence times, error bars) reads it instead of clustering the frames again.
+#Probabilities are column sums of the bits and the number of monomers inside a frame is a popcount of its row.
+#Usage: python membership_store.py /path/to/output_files/ /path/to/run.membership [--store results.db] [--workers N]
+###############################################################################################################################################################
+
+import argparse
+import csv
+import json
+import os
+import numpy as np
+from bond_forces import N_MONO
+from frame_engine import Consumer, run_engine
+from result_store import ResultStore
+from condensate_detection import add_epsilon_arguments
+
+BITS = "membership.bits"
+INDEX = "index.csv"
+META = "meta.json"
+
+#number of set bits of every byte value
+_POPCOUNT = np.array([bin(b).count("1") for b in range(256)], dtype=np.uint8)
+
+
+def popcount(bits, axis=-1):
+    """Number of set bits along axis of a uint8 array."""
+    counts = np.bitwise_count(bits) if hasattr(np, "bitwise_count") else _POPCOUNT[bits]
+    return counts.sum(axis=axis, dtype=np.int64)
+
+
+def membership_rows(labels, particle_ids, n_mono=N_MONO):
+    """0/1 membership of the monomers (particle ids 0 ... n_mono-1, in file order) from the DBSCAN labels of a frame."""
+    monomers = (particle_ids > -1) & (particle_ids < n_mono)
+    return (labels[monomers] > -1).astype(np.int8)
+
+
+class MembershipStore:
+    """
+    Bit-packed (frames, n_mono) membership. mode "r" opens an existing store, "a" appends to it (and creates it if needed),
+    "w" starts a new one. Frames are addressed by their position in the store, slices give random access to frame ranges.
+    """
+
+    def __init__(self, path, mode="r", n_mono=N_MONO):
+        self.path = path
+        self.mode = mode
+        if mode == "w" or (mode == "a" and not os.path.isfile(os.path.join(path, META))):
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, META), "w") as fh:
+                json.dump({"n_mono": n_mono}, fh)
+            open(os.path.join(path, BITS), "wb").close()
+            with open(os.path.join(path, INDEX), "w", newline="") as fh:
+                csv.writer(fh).writerow(["filename", "epsilon"])
+        with open(os.path.join(path, META)) as fh:
+            self.n_mono = json.load(fh)["n_mono"]
+        self.row_bytes = -(-self.n_mono // 8)
+        with open(os.path.join(path, INDEX), newline="") as fh:
+            rows = list(csv.DictReader(fh))
+        self.filenames = [row["filename"] for row in rows]
+        self.epsilons = [float(row["epsilon"]) for row in rows]
+        self._bits = None
+
+    def __len__(self):
+        return len(self.filenames)
+
+    @property
+    def bits(self):
+        """(frames, row_bytes) packed membership, memory-mapped."""
+        if self._bits is None or len(self._bits) != len(self):
+            if not len(self):
+                return np.zeros((0, self.row_bytes), dtype=np.uint8)
+            self._bits = np.memmap(os.path.join(self.path, BITS), dtype=np.uint8, mode="r", shape=(len(self), self.row_bytes))
+        return self._bits
+
+    def append(self, membership, filenames, epsilons):
+        """Add the (frames, n_mono) 0/1 membership of new frames with their file names and eps."""
+        if self.mode == "r":
+            raise ValueError(f"{self.path} is opened read-only")
+        membership = np.atleast_2d(membership)
+        if membership.shape[1] != self.n_mono:
+            raise ValueError(f"expected {self.n_mono} monomers, got {membership.shape[1]}")
+        self.append_bits(np.packbits(membership.astype(bool), axis=1), filenames, epsilons)
+
+    def append_bits(self, bits, filenames, epsilons):
+        with open(os.path.join(self.path, BITS), "ab") as fh:
+            fh.write(np.ascontiguousarray(bits, dtype=np.uint8).tobytes())
+        with open(os.path.join(self.path, INDEX), "a", newline="") as fh:
+            csv.writer(fh).writerows(zip(filenames, epsilons))
+        self.filenames.extend(filenames)
+        self.epsilons.extend(float(e) for e in epsilons)
+
+    def membership(self, start=0, stop=None):
+        """Unpacked (frames, n_mono) int8 membership of the frames start ... stop-1."""
+        return np.unpackbits(self.bits[start:stop], axis=1, count=self.n_mono).astype(np.int8)
+
+    def counts(self, start=0, stop=None):
+        """Number of frames in which every monomer is inside the condensate, from the column sums of the 8 bit planes."""
+        bits = self.bits[start:stop]
+        planes = np.empty((self.row_bytes, 8), dtype=np.int64)
+        for b in range(8):
+            planes[:, b] = ((bits >> (7 - b)) & 1).sum(axis=0, dtype=np.int64)
+        return planes.ravel()[:self.n_mono]
+
+    def probability(self, start=0, stop=None):
+        """Probability of every monomer being inside the condensate over the frames start ... stop-1 (e.g. start=-3000 for the last 3000)."""
+        n = len(range(*slice(start, stop).indices(len(self))))
+        if not n:
+            raise ValueError("no frames selected")
+        return self.counts(start, stop) / n
+
+    def inside(self, start=0, stop=None, first=0, last=None):
+        """Number of monomers first ... last-1 inside the condensate in every frame start ... stop-1 (popcount of the masked rows)."""
+        last = self.n_mono if last is None else last
+        mask = np.packbits((np.arange(self.n_mono) >= first) & (np.arange(self.n_mono) < last))
+        return popcount(self.bits[start:stop] & mask, axis=1)
+
+
+class MembershipConsumer(Consumer):
+    """Writes the packed membership of every frame to a MembershipStore (frame_engine.run_engine)."""
+    name = "membership"
+
+    def __init__(self, path, mode="w", n_mono=N_MONO):
+        self.store = MembershipStore(path, mode, n_mono)
+
+    def recorder(self):
+        return frame_bits
+
+    def add(self, record):
+        self.store.append_bits(record['bits'][None], [str(record['filename'])], [float(record['epsilon'])])
+
+    def write(self):
+        return len(self.store)
+
+
+def frame_bits(frame):
+    return {'bits': np.packbits(membership_rows(frame.labels, frame.ids).astype(bool)),
+            'filename': os.path.basename(frame.name), 'epsilon': frame.epsilon}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster the frames of a run once and save the bit-packed membership of the monomers.")
+    parser.add_argument("source", help="directory with config_* files or trajectory cache")
+    parser.add_argument("membership", help="output directory of the membership store")
+    parser.add_argument("--store", help="SQLite file with per-frame results; only new or changed frames are clustered again")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes used for the per-frame clustering")
+    add_epsilon_arguments(parser)
+    args = parser.parse_args()
+
+    store = ResultStore(args.store) if args.store else None
+    n_frames, outputs = run_engine(args.source, [MembershipConsumer(args.membership)], args.workers, store=store,
+                                   epsilon_mode=args.epsilon_mode, epsilon_block=args.epsilon_block, epsilon_sample=args.epsilon_sample,
+                                   method=args.method)
+    if store is not None:
+        store.close()
+    print(f"{n_frames} frames written to {args.membership}")
@@ -0,0 +1,159 @@
+###############################################################################################################################################################
+#Protein side of the condensate, from the DBSCAN labels which the force and probability analyses compute anyway (no extra clustering).
+#For every frame and every cluster: number of proteins (type 24), number of monomers (particle id < 500) and volume, estimated either
+#   voxel : number of occupied cubic voxels of edge VOXEL_SIZE times their volume (default)
+#   hull  : volume of the convex hull of the cluster members
+#The condensate of a frame is its largest cluster. Its protein density, the dilute protein concentration (unclustered proteins per free volume
+#of the box) and their ratio, the partition coefficient, are reported for every frame; means are taken over the last 3000 frames.
+#The walls of the simulation box are at 0 and box_length in every direction (80 x 80 x 600, the particles of the saved frames fill the whole box).
+#Usage: python partition_calculation.py [--volume voxel|hull] [--workers N] [--store results.db]
+###############################################################################################################################################################
+
+import argparse
+import os
+from functools import partial
+import numpy as np
+import pandas as pd
+from scipy.spatial import ConvexHull, QhullError
+from bond_forces import N_MONO
+from frame_engine import Consumer, run_engine
+from result_store import ResultStore
+from condensate_detection import add_epsilon_arguments
+
+PROTEIN_TYPE = 24
+BOX = (80.0, 80.0, 600.0)
+VOXEL_SIZE = 1.5
+VOLUME_METHODS = ("voxel", "hull")
+WINDOW = 3000
+
+
+def cluster_counts(labels, particle_ids, types):
+    """Number of proteins and monomers of every cluster, and the number of proteins outside all clusters."""
+    n_clusters = int(labels.max()) + 1 if len(labels) else 0
+    protein = types == PROTEIN_TYPE
+    monomer = (particle_ids > -1) & (particle_ids < N_MONO)
+    clustered = labels > -1
+    proteins = np.bincount(labels[clustered & protein], minlength=n_clusters)
+    monomers = np.bincount(labels[clustered & monomer], minlength=n_clusters)
+    return proteins, monomers, int(np.count_nonzero(protein & ~clustered))
+
+
+def voxel_volumes(positions, labels, n_clusters, voxel=VOXEL_SIZE):
+    """Volume of every cluster as the number of distinct voxels its members occupy times voxel**3."""
+    clustered = labels > -1
+    if not clustered.any():
+        return np.zeros(n_clusters)
+    cells = np.floor(positions[clustered] / voxel).astype(np.int64)
+    cells -= cells.min(axis=0)
+    dims = cells.max(axis=0) + 1
+    n_cells = int(np.prod(dims))
+    keys = labels[clustered] * n_cells + np.ravel_multi_index(cells.T, dims)
+    occupied = np.unique(keys) // n_cells
+    return np.bincount(occupied, minlength=n_clusters) * voxel ** 3
+
+
+def hull_volumes(positions, labels, n_clusters):
+    """Volume of the convex hull of every cluster; 0 for clusters which are too small or flat for a hull."""
+    volumes = np.zeros(n_clusters)
+    order = np.argsort(labels, kind="stable")
+    bounds = np.searchsorted(labels[order], np.arange(n_clusters + 1))
+    for c in range(n_clusters):
+        points = positions[order[bounds[c]:bounds[c + 1]]]
+        if len(points) < 4:
+            continue
+        try:
+            volumes[c] = ConvexHull(points).volume
+        except QhullError:
+            pass
+    return volumes
+
+
+def frame_record(frame, volume="voxel", voxel=VOXEL_SIZE):
+    proteins, monomers, dilute = cluster_counts(frame.labels, frame.ids, frame.types)
+    if volume == "hull":
+        volumes = hull_volumes(frame.positions, frame.labels, len(proteins))
+    else:
+        volumes = voxel_volumes(frame.positions, frame.labels, len(proteins), voxel)
+    return {'epsilon': frame.epsilon, 'proteins': proteins, 'monomers': monomers, 'volumes': volumes, 'dilute_proteins': dilute}
+
+
+def frame_summary(record, box=BOX):
+    """Condensate (largest cluster) observables of one frame record."""
+    proteins, monomers, volumes = record['proteins'], record['monomers'], record['volumes']
+    dilute_volume = np.prod(box) - volumes.sum()
+    dilute_concentration = float(record['dilute_proteins']) / dilute_volume
+    row = {'n_clusters': len(proteins), 'condensate_proteins': 0, 'condensate_monomers': 0, 'condensate_volume': 0.0,
+           'condensate_density': np.nan, 'dilute_proteins': int(record['dilute_proteins']),
+           'dilute_concentration': dilute_concentration, 'partition_coefficient': np.nan}
+    if len(proteins):
+        c = int(np.argmax(proteins + monomers))
+        row.update(condensate_proteins=int(proteins[c]), condensate_monomers=int(monomers[c]), condensate_volume=float(volumes[c]))
+        if volumes[c] > 0:
+            row['condensate_density'] = proteins[c] / volumes[c]
+            if dilute_concentration > 0:
+                row['partition_coefficient'] = row['condensate_density'] / dilute_concentration
+    return row
+
+
+class PartitionConsumer(Consumer):
+    """Per-cluster composition and per-frame condensate/dilute phase observables for frame_engine.run_engine."""
+    name = "partition"
+
+    def __init__(self, output_dir='/path/to/directory', volume="voxel", voxel=VOXEL_SIZE, box=BOX):
+        if volume not in VOLUME_METHODS:
+            raise ValueError(f"unknown volume estimate {volume!r}, expected one of {VOLUME_METHODS}")
+        self.output_dir = output_dir
+        self.volume = volume
+        self.voxel = voxel
+        self.box = box
+        self.frames = []
+        self.clusters = []
+
+    def params(self):
+        return {"volume": self.volume, "voxel": self.voxel if self.volume == "voxel" else None}
+
+    def recorder(self):
+        return partial(frame_record, volume=self.volume, voxel=self.voxel)
+
+    def add(self, record):
+        k = len(self.frames)
+        self.frames.append(dict(frame=k, epsilon=float(record['epsilon']), **frame_summary(record, self.box)))
+        n = len(record['proteins'])
+        self.clusters.append(pd.DataFrame({'frame': k, 'cluster': np.arange(n), 'proteins': record['proteins'],
+                                           'monomers': record['monomers'], 'volume': record['volumes']}))
+
+    def write(self):
+        """Writes cluster_composition.csv and partition.dat; returns the per-frame table."""
+        frames = pd.DataFrame(self.frames)
+        frames.to_csv(os.path.join(self.output_dir, 'partition.dat'), index=False)
+        if self.clusters:
+            pd.concat(self.clusters, ignore_index=True).to_csv(os.path.join(self.output_dir, 'cluster_composition.csv'), index=False)
+        return frames
+
+
+def window_means(frames, window=WINDOW):
+    """Mean condensate density, dilute concentration and partition coefficient over the last window frames."""
+    tail = frames.tail(window)
+    return {name: float(tail[name].mean()) for name in ('condensate_proteins', 'condensate_density', 'dilute_concentration', 'partition_coefficient')}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Proteins, monomers and volume of the clusters, dilute phase concentration and partition coefficient.")
+    parser.add_argument("--volume", choices=VOLUME_METHODS, default="voxel", help="cluster volume from occupied voxels or from the convex hull")
+    parser.add_argument("--voxel", type=float, default=VOXEL_SIZE, help="voxel edge for the voxel volume estimate")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes used for the per-frame clustering")
+    parser.add_argument("--store", help="SQLite file with per-frame results; only new or changed frames are analysed again")
+    add_epsilon_arguments(parser)
+    args = parser.parse_args()
+
+    # assigning directory (config_* files, or a trajectory cache made with trajectory_cache.py) and output directory
+    directory = '/path/to/output_files/'
+    output_dir = '/path/to/directory'
+
+    store = ResultStore(args.store) if args.store else None
+    n_frames, outputs = run_engine(directory, [PartitionConsumer(output_dir, args.volume, args.voxel)], args.workers, store=store,
+                                   epsilon_mode=args.epsilon_mode, epsilon_block=args.epsilon_block, epsilon_sample=args.epsilon_sample,
+                                   method=args.method)
+    if store is not None:
+        store.close()
+    print(window_means(outputs["partition"]))
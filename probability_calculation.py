@@ -7,135 +7,148 @@
 ####################################################################################################################################################################
 
 #importing libraries
+import argparse
 import os
+from functools import partial
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from sklearn.cluster import DBSCAN
-from sklearn.neighbors import NearestNeighbors
-from scipy.signal import savgol_filter
-from natsort import natsorted
-from scipy.signal import find_peaks
-
-
-#for DBSCAN, given parameter Min_points = 2 * dimension [sander et al. 1998]
-#calculate distance with 6th nearest neighbor given Min_points = 6
-def calculate_nearest_neighbors(i):
-    neighb = NearestNeighbors(n_neighbors=6)
-    nbrs = neighb.fit(i)
-    distances, indices = nbrs.kneighbors(i)
-    return distances, indices
-
-#arrange the distance between pairs in asending order
-#as rcut for attractive LJ-potential is 2.5 sigma, any particle pair which has distance more than rcut is not interacting so it is removed from calculating eps parameter
-def sort_and_filter_distances(distances, cutoff_value=2.5):
-    distances = np.sort(distances, axis=0)
-    distances = distances[:, 5]
-    distances = distances[distances <= cutoff_value]
-    return distances
-
-
-#as the k-distance curve has noise, point of maximum curvature can go to unreasonable values on the k-distance curve
-#here as a smoothing filter we are using savgol filter which fits a polynomial of given order to a given window of data points on the curve
-def smooth_data(distances):
-    x = range(len(distances))
-    smoothed_data = savgol_filter(distances, window_length=199, polyorder=3, mode='nearest')
-    return smoothed_data
-
-
-#the distance point on the curve for which the second derivative (curvature) is maximum (knee point) is treated as epsilon 
-def calculate_derivatives(smoothed_data):
-    x = range(len(smoothed_data))
-    slope = np.gradient(smoothed_data, x)
-    second_derivative = np.gradient(slope, x)
-    return slope, second_derivative
-
-def find_curvature_peaks(second_derivative):
-    peaks, _ = find_peaks(second_derivative)
-    return peaks
-
-def find_max_curvature_point(distances, second_derivative):
-    max_curvature_index = np.argmax(second_derivative)
-    max_curvature_point = distances[max_curvature_index]
-    return max_curvature_index, max_curvature_point
-
-
-matrix = []
-epsilon_list = []
-
-
-# assigning directory
-directory = '/path/to/output_files/'
-
-
-for filename in natsorted(os.listdir(directory)):
-    f = os.path.join(directory, filename)
-
-    if os.path.isfile(f):
-        i = pd.read_csv(f, sep=" ", header=None, names=["index", "x_pos", "y_pos", "z_pos", "type"])
-        print(f)
-
-        i = i.drop(0, axis=0)
-        b = len(i)
-        i = i.drop(b, axis=0)
-        i = i.drop('type', axis=1)
-        i = i.drop('index', axis=1)
-
-        distances, indices = calculate_nearest_neighbors(i)
-
-        filtered_distances = sort_and_filter_distances(distances)
-
-        smoothed_distances = smooth_data(filtered_distances)
-
-        slope, second_derivative = calculate_derivatives(smoothed_distances)
-
-        curvature_peaks = find_curvature_peaks(second_derivative)
-
-        max_curvature_index, max_curvature_point = find_max_curvature_point(filtered_distances, second_derivative)
-        epsilon = max_curvature_point
-
-        neighb = NearestNeighbors(n_neighbors=6)  
-        nbrs = neighb.fit(i) 
-        distances, indices = nbrs.kneighbors(i)
-        epsilon_list.append(epsilon)
-
-        dbscan = DBSCAN(eps=epsilon, min_samples=6).fit(i)  
+from trajectory_cache import frame_name
+from condensate_detection import detection_params, epsilon_schedule, add_epsilon_arguments
+from profiling import StageTimer, ProfileLog, add_profile_arguments
+from result_store import ResultStore, cached_frames
+from bond_forces import N_MONO
+from accumulators import WindowAccumulator
+from frame_watcher import follow_results, add_follow_arguments
+from frame_engine import Consumer, read_frame
+from membership_store import membership_rows
+
+
+#score of each monomer: 1 if it is inside the condensate and 0 if not
+#frame is a frame_engine.Frame with the DBSCAN labels of the configuration
+def frame_record(frame):
+    return {'epsilon': frame.epsilon, 'membership': membership_rows(frame.labels, frame.ids)}
+
+
+#work done for a single configuration, run in the worker processes when --workers > 1
+#with profile=True the stage timings of the frame are returned as well (None otherwise)
+#epsilon is given when eps is estimated per block or per run instead of per frame
+def process_frame(ref, profile=False, epsilon=None, method="dbscan"):
+    timer = StageTimer(enabled=profile)
+    frame = read_frame(ref, timer, epsilon=epsilon, method=method)
+    with timer.stage("scores"):
+        record = frame_record(frame)
+    return record, (timer if profile else None)
+
+
+#probability profile of the last 3000 configurations and its plot
+#title labels the run (sweep.py passes the values of every run of a sweep)
+def write_outputs(matrix, epsilon_list, epsilon_mode, output_dir='/path/to/directory', title="Conc: 0.002, Re: 0.6, Replicate: 1"):
+    probability = pd.Series(matrix.mean())
+    probability.to_csv(os.path.join(output_dir, 'probability.dat'))
+    #exact sum and count of the scores, replicates can be pooled with accumulators.merge_saved
+    matrix.running_mean().save(os.path.join(output_dir, 'probability_sum.npz'))
+    #eps used for each configuration of the window and how it was estimated
+    pd.DataFrame({'epsilon': epsilon_list.values(), 'mode': epsilon_mode}).to_csv(os.path.join(output_dir, 'epsilon.dat'))
+
+    plt.figure(figsize=(12, 6))
+    plt.plot(probability, label="Probability", color="blue")
+    plt.title(f"Probability Array with Transitions ({title})")
+    plt.xlabel("Index")
+    plt.ylabel("Probability")
+    plt.grid(True)
+    plt.savefig(os.path.join(output_dir, 'prob_profile.svg'), format='svg')
+    plt.close()
+    return probability
+
+
+class ProbabilityConsumer(Consumer):
+    """Membership scores of the last 3000 configurations, for analyse_run and frame_engine.run_engine."""
+    name = "probability"
+
+    def __init__(self, output_dir='/path/to/directory', title="Conc: 0.002, Re: 0.6, Replicate: 1", epsilon_mode="frame"):
+        self.outputs = partial(write_outputs, epsilon_mode=epsilon_mode, output_dir=output_dir, title=title)
+        #scores of the last 3000 configurations with their running sum, the memory does not grow with the number of frames
+        self.matrix = WindowAccumulator(N_MONO, window=3000, dtype=np.int8)
+        self.epsilon_list = WindowAccumulator(window=3000)
+
+    def recorder(self):
+        return frame_record
+
+    def add(self, record):
+        epsilon, result = float(record['epsilon']), record['membership']
         print(f'epsilon:{epsilon}')
-        labels = dbscan.labels_
-        x = i['x_pos'].astype(float)
-        y = i['y_pos'].astype(float)
-        z = i['z_pos'].astype(float)
-        n_clusters_ = len(set(labels)) - (1 if -1 in labels else 0)
-        n_noise_ = list(labels).count(-1)
-        df2 = pd.DataFrame()
-        particle_ID = list(range(0, b - 1))
-        df2['particle_id'] = np.array(particle_ID)
-        df2['labels'] = np.array(labels)
-        df2['x_pos'] = np.array(x)
-        df2['y_pos'] = np.array(y)
-        df2['z_pos'] = np.array(z)
-
-        df3 = df2.query("-1 < particle_id < 500")
-        labels__ = df3['labels']
-        result = [1 if num > -1 else 0 for num in labels__]
-        matrix.append(result)
+        self.epsilon_list.add(epsilon)
+        self.matrix.add(result)
+
+    def write(self):
+        return self.outputs(self.matrix, self.epsilon_list)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Probability of each monomer being inside the condensate.")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes used for the per-frame clustering")
+    add_profile_arguments(parser)
+    parser.add_argument("--store", help="SQLite file with per-frame results; only new or changed frames are analysed again")
+    add_follow_arguments(parser)
+    add_epsilon_arguments(parser)
+    return parser
+
+
+def analyse_run(directory, args, output_dir='/path/to/directory', title="Conc: 0.002, Re: 0.6, Replicate: 1"):
+    """
+    Probability analysis of one run (config_* files, or a trajectory cache made with trajectory_cache.py) with the options in args (see build_parser).
+    Writes the outputs to output_dir and returns (probability profile, number of frames analysed).
+    """
+    profile = args.profile or bool(args.profile_log)
+    timings = StageTimer(enabled=profile)
+    log = ProfileLog(args.profile_log)
+    store = ResultStore(args.store) if args.store else None
+    #epsilon.dat records the eps mode, or the detection method if eps is not used
+    consumer = ProbabilityConsumer(output_dir, title, args.epsilon_mode if args.method == "dbscan" else args.method)
+
+    worker = partial(process_frame, profile=profile, method=args.method)
+    params = detection_params(args.method)
+    if args.follow:
+        block_size = args.epsilon_block if args.epsilon_mode == "block" and args.method == "dbscan" else None
+        results = follow_results(worker, directory, store, "probability", params, args.poll, args.idle_timeout, block_size)
+    else:
+        schedule = None if args.method != "dbscan" else partial(epsilon_schedule, mode=args.epsilon_mode, block_size=args.epsilon_block,
+                           sample_size=args.epsilon_sample, workers=args.workers)
+        results = cached_frames(worker, directory, store, "probability", params, workers=args.workers, schedule=schedule)
+
+    for ref, record, timer in results:
+        timings.merge(timer)
+        log.frame(frame_name(ref), timer)
+        print(frame_name(ref))
+        consumer.add(record)
+        #snapshot of the outputs while following a running simulation
+        if args.follow and consumer.matrix.total % args.snapshot_every == 0:
+            consumer.write()
+    if store is not None:
+        store.close()
+    if not consumer.matrix.total:
+        raise ValueError(f"No configuration files found in {directory}")
 
 ##########################################################################################################################################################
 
-df4 = pd.DataFrame(matrix)
-df5 = df4.tail(3000)
+    with timings.stage("write"):
+        probability = consumer.write()
+    wall = log.close(timings, consumer.matrix.total)
 
-probability = df5.mean(axis=0)
-probability.to_csv('/path/to/directory/probability.dat')
+    if profile:
+        print(timings.report(consumer.matrix.total, wall))
+    return probability, consumer.matrix.total
 
-plt.figure(figsize=(12, 6))
-plt.plot(probability, label="Probability", color="blue")
-plt.title("Probability Array with Transitions (Conc: 0.002, Re: 0.6, Replicate: 1)")
-plt.xlabel("Index")
-plt.ylabel("Probability")
-plt.grid(True)
-plt.savefig('/path/to/directory/prob_profile.svg', format='svg')
-plt.close()
 
-##############################################################################################################################################################################################################
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.follow and args.epsilon_mode == "global" and args.method == "dbscan":
+        parser.error("--epsilon-mode global needs the whole run and cannot be used with --follow")
+
+    # assigning directory (config_* files, or a trajectory cache made with trajectory_cache.py)
+    directory = '/path/to/output_files/'
+    analyse_run(directory, args)
 
+##############################################################################################################################################################################################################
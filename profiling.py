@@ -0,0 +1,123 @@
+###############################################################################################################################################################
+#Per-stage wall clock timings and counters for the analysis scripts (enabled with --profile or --profile-log).
+#Each stage of the per-frame work is wrapped in `with timer.stage("name"):`, and per-frame quantities are added with timer.count("name", value),
+#e.g. the bytes read, the number of particles, clusters and noise points of a frame.
+#Timers of different frames or worker processes are merged and printed as a table at the end of the run, together with the frames per second
+#and the peak resident memory. With --profile-log the timings and counters of every frame and a summary are also written as JSON lines.
+#A disabled timer does no timing or counting at all, so the stage blocks cost nothing in a normal run.
+###############################################################################################################################################################
+
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+_NULL = nullcontext()
+
+
+class StageTimer:
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.totals = {}
+        self.counts = {}
+        self.counters = {}
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        """Add value to the counter name (e.g. bytes read or clusters found); does nothing if the timer is disabled."""
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add(self, name, seconds, count=1):
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def merge(self, other):
+        """Add the timings of another timer (e.g. returned by a worker process)."""
+        if other is None:
+            return
+        for name, seconds in other.totals.items():
+            self.add(name, seconds, other.counts[name])
+        for name, value in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        """Stage times in seconds and counters, JSON serialisable."""
+        return {"stages": dict(self.totals), "counters": {name: int(value) for name, value in self.counters.items()}}
+
+    def report(self, frames=None, wall=None):
+        """
+        Table of total and per-call time for every stage, in the order the stages were first seen, followed by the counters (total and per frame),
+        the throughput (if the wall clock time of the run is given) and the peak resident memory.
+        """
+        total = sum(self.totals.values())
+        lines = [f"{'stage':<16}{'calls':>8}{'total [s]':>12}{'per call [ms]':>16}{'share':>8}"]
+        for name, seconds in self.totals.items():
+            calls = self.counts[name]
+            share = seconds / total if total else 0.0
+            lines.append(f"{name:<16}{calls:>8}{seconds:>12.3f}{1e3 * seconds / calls:>16.2f}{share:>8.1%}")
+        lines.append(f"{'total':<16}{'':>8}{total:>12.3f}")
+        if frames:
+            lines.append(f"{frames} frames, {1e3 * total / frames:.2f} ms of work per frame")
+        for name, value in self.counters.items():
+            lines.append(f"{name:<16}{value:>12}" + (f"{value / frames:>16.1f} per frame" if frames else ""))
+        if frames and wall:
+            lines.append(f"{frames / wall:.2f} frames/s ({wall:.2f} s wall clock)")
+        lines.append(f"peak RSS {peak_rss_mb():.1f} MB")
+        return "\n".join(lines)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process or of its largest finished child process (e.g. a pool worker), in MB."""
+    #ru_maxrss is in kB on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak * unit / 2 ** 20
+
+
+class ProfileLog:
+    """
+    JSON lines profile of a run: one line with the stage times and counters of every analysed frame, and a summary line at the end.
+    With path None nothing is written.
+    """
+
+    def __init__(self, path=None):
+        self.fh = open(path, "w") if path else None
+        self.start = time.perf_counter()
+
+    def frame(self, name, timer):
+        if self.fh is None or timer is None:
+            return
+        self.fh.write(json.dumps({"frame": str(name), **timer.as_dict()}) + "\n")
+
+    def close(self, timings, frames):
+        """Write the summary (merged timings, frames per second, peak RSS) and close the file. Returns the wall clock time since the start."""
+        wall = time.perf_counter() - self.start
+        if self.fh is not None:
+            summary = {"summary": True, "frames": frames, "wall_seconds": wall, "frames_per_second": frames / wall if wall else None,
+                       "peak_rss_mb": peak_rss_mb(), **timings.as_dict()}
+            self.fh.write(json.dumps(summary) + "\n")
+            self.fh.close()
+            self.fh = None
+        return wall
+
+
+def add_profile_arguments(parser):
+    """Command line options of the profiling, shared by the analysis scripts."""
+    parser.add_argument("--profile", action="store_true", help="print the time spent in each stage of the per-frame work and the counters")
+    parser.add_argument("--profile-log", help="also write the timings and counters of every frame and a summary to this JSON lines file")
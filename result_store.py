@@ -0,0 +1,160 @@
+###############################################################################################################################################################
+#Persistent per-frame result store (SQLite) so that a rerun only analyses new or changed configurations.
+#Every row holds the outputs of one analysis for one frame, keyed by:
+#   analysis  : name of the per-frame analysis, e.g. "force" or "probability"
+#   path      : the configuration file (or the frame inside a trajectory cache)
+#   params    : the analysis parameters as sorted JSON
+#and is only reused while the signature of the frame (mtime and size, or a content hash) is unchanged.
+#The outputs are stored as a dict of numpy arrays.
+###############################################################################################################################################################
+
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import numpy as np
+from trajectory_cache import open_cache, list_frame_refs
+from condensate_detection import map_refs
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    analysis TEXT NOT NULL,
+    path TEXT NOT NULL,
+    params TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    record BLOB NOT NULL,
+    PRIMARY KEY (analysis, path, params)
+)
+"""
+
+
+def frame_key(ref):
+    """Path under which a frame reference (see trajectory_cache.list_frame_refs) is stored."""
+    if isinstance(ref, tuple):
+        source, k = ref
+        return f"{os.path.abspath(source)}#{k}"
+    return os.path.abspath(ref)
+
+
+def frame_signature(ref, use_hash=False):
+    """
+    Signature of the frame contents: modification time and size of the file, or with use_hash a sha1 of the frame data.
+    For a trajectory cache or binary trajectory the signature comes from the trajectory (see trajectory_cache.Trajectory.signature).
+    """
+    if isinstance(ref, tuple):
+        source, k = ref
+        if use_hash:
+            return hashlib.sha1(np.ascontiguousarray(open_cache(source).frame(k)[1]).tobytes()).hexdigest()
+        return open_cache(source).signature(k)
+    if use_hash:
+        with open(ref, "rb") as fh:
+            return hashlib.sha1(fh.read()).hexdigest()
+    st = os.stat(ref)
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def encode_record(record):
+    buffer = io.BytesIO()
+    np.savez(buffer, **{name: np.asarray(value) for name, value in record.items()})
+    return buffer.getvalue()
+
+
+def decode_record(blob):
+    with np.load(io.BytesIO(blob)) as data:
+        return {name: data[name] for name in data.files}
+
+
+class ResultStore:
+
+    def __init__(self, path, use_hash=False):
+        self.path = path
+        self.use_hash = use_hash
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(_SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _params(params):
+        return json.dumps(params, sort_keys=True)
+
+    def get(self, analysis, ref, params):
+        """Stored record of the frame, or None if it is missing or the frame has changed since it was stored."""
+        row = self.connection.execute(
+            "SELECT signature, record FROM results WHERE analysis = ? AND path = ? AND params = ?",
+            (analysis, frame_key(ref), self._params(params))).fetchone()
+        if row is None or row[0] != frame_signature(ref, self.use_hash):
+            return None
+        return decode_record(row[1])
+
+    def analyses(self):
+        """Names of the analyses with stored records."""
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT analysis FROM results")]
+
+    def records(self, analysis, ref):
+        """Yield (params, record) of every record of analysis stored for the frame with any parameters, if the frame is unchanged."""
+        signature = frame_signature(ref, self.use_hash)
+        rows = self.connection.execute("SELECT params, signature, record FROM results WHERE analysis = ? AND path = ?",
+                                       (analysis, frame_key(ref)))
+        for params, stored, blob in rows.fetchall():
+            if stored == signature:
+                yield json.loads(params), decode_record(blob)
+
+    def put(self, analysis, ref, params, record):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results (analysis, path, params, signature, record) VALUES (?, ?, ?, ?, ?)",
+            (analysis, frame_key(ref), self._params(params), frame_signature(ref, self.use_hash), encode_record(record)))
+
+    def map(self, worker, refs, analysis, params, workers=1, epsilons=None, commit_every=100):
+        """
+        Yield (ref, record, timer) for every frame reference in order.
+        Stored records are reused (timer is None for them); the other frames are computed with worker(ref) -> (record, timer),
+        on a process pool when workers > 1, and their records are stored.
+        With epsilons (one eps per reference, see condensate_detection.epsilon_schedule) the worker is called as
+        worker(ref, epsilon=eps) and eps becomes part of the parameters of the frame.
+        """
+        if epsilons is None:
+            frame_params = [params] * len(refs)
+        else:
+            frame_params = [dict(params, epsilon=float(epsilon)) for epsilon in epsilons]
+        cached = [self.get(analysis, ref, p) for ref, p in zip(refs, frame_params)]
+        missing = [k for k, record in enumerate(cached) if record is None]
+        computed = map_refs(worker, [refs[k] for k in missing], workers=workers,
+                            epsilons=None if epsilons is None else [epsilons[k] for k in missing])
+        n_new = 0
+        for ref, p, record in zip(refs, frame_params, cached):
+            if record is not None:
+                yield ref, record, None
+                continue
+            record, timer = next(computed)
+            self.put(analysis, ref, p, record)
+            n_new += 1
+            if n_new % commit_every == 0:
+                self.connection.commit()
+            yield ref, record, timer
+        self.connection.commit()
+
+
+def cached_frames(worker, source, store, analysis, params, workers=1, schedule=None):
+    """
+    Yield (ref, record, timer) for every frame of source in frame order, with worker(ref) -> (record, timer).
+    schedule(refs) may return one eps per frame (see condensate_detection.epsilon_schedule) or None.
+    Without a store (store is None) every frame is computed.
+    """
+    refs = list_frame_refs(source)
+    epsilons = schedule(refs) if schedule is not None else None
+    if store is None:
+        for ref, (record, timer) in zip(refs, map_refs(worker, refs, workers=workers, epsilons=epsilons)):
+            yield ref, record, timer
+        return
+    yield from store.map(worker, refs, analysis, params, workers=workers, epsilons=epsilons)
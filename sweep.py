@@ -0,0 +1,148 @@
+###############################################################################################################################################################
+#Batch driver for a whole parameter sweep (sequence x Re x concentration x replicate).
+#The runs are listed in a CSV manifest with the columns
+#   sequence, re, concentration, replicate, directory[, output_dir][, l_0]
+#where a cell may hold several values separated by ";" and every combination of them is one run.
+#directory and output_dir may use the placeholders {sequence}, {re}, {concentration} and {replicate}, e.g.
+#   sequence,re,concentration,replicate,directory
+#   homo;lambda,0.2;0.6,84.5,1;2;3,/data/{sequence}/Re_{re}/conc_{concentration}/rep_{replicate}/output_files
+#l_0 is taken from bond_forces.L0_BY_RE for the Re of the run unless the manifest gives it.
+#The runs are spread over a local process pool, one run per process at a time; every run keeps only its 3000-frame windows in memory,
+#so the memory used is bounded by the number of processes. The summary of all runs is written to one CSV table.
+###############################################################################################################################################################
+
+import argparse
+import itertools
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+import force_calculation
+import probability_calculation
+import kymograph
+import partition_calculation
+from bond_forces import rest_length, force_pn
+from error_analysis import summarize
+from result_store import ResultStore
+from frame_engine import run_engine
+from condensate_detection import add_epsilon_arguments
+
+ANALYSES = ("force", "probability", "kymograph", "partition")
+GRID_COLUMNS = ["sequence", "re", "concentration", "replicate"]
+ERROR_BLOCKS = 20 #blocks for the blocked standard error of the force
+ERROR_SEED = 0 #seed of the block bootstrap, so that a rerun gives the same intervals
+
+
+def read_manifest(path, output_root="sweep_output"):
+    """Expand the manifest into one dict per run, in manifest order."""
+    manifest = pd.read_csv(path, dtype=str, comment="#").fillna("")
+    missing = [c for c in GRID_COLUMNS + ["directory"] if c not in manifest.columns]
+    if missing:
+        raise ValueError(f"manifest {path} lacks the columns {missing}")
+    runs = []
+    for row in manifest.to_dict("records"):
+        values = [[v.strip() for v in row[c].split(";")] for c in GRID_COLUMNS]
+        for combination in itertools.product(*values):
+            run = dict(zip(GRID_COLUMNS, combination))
+            run["directory"] = row["directory"].format(**run)
+            output_dir = row.get("output_dir") or os.path.join(output_root, "{sequence}_Re_{re}_conc_{concentration}_rep_{replicate}")
+            run["output_dir"] = output_dir.format(**run)
+            run["l_0"] = float(row["l_0"]) if row.get("l_0") else rest_length(run["re"])
+            runs.append(run)
+    return runs
+
+
+def analyse(item):
+    """
+    Run the selected analyses on one run of the sweep in a single pass over its frames (frame_engine.run_engine). Returns the summary row of the run;
+    a failing run is reported in the status column instead of stopping the sweep.
+    """
+    k, run, analyses, options = item
+    row = dict(run, run=k, status="ok")
+    label = f"Conc: {run['concentration']}, Re: {run['re']}, Replicate: {run['replicate']}"
+    store = None
+    epsilon_mode = options["epsilon_mode"] if options["method"] == "dbscan" else options["method"]
+    try:
+        os.makedirs(run["output_dir"], exist_ok=True)
+        consumers = []
+        if "force" in analyses:
+            force_consumer = force_calculation.ForceConsumer(run["output_dir"], run["l_0"], label, epsilon_mode=epsilon_mode,
+                                                             plot_name=f"{run['sequence']}_{run['re']}_rep_{run['replicate']}_force_vs_time.svg")
+            consumers.append(force_consumer)
+        if "probability" in analyses:
+            consumers.append(probability_calculation.ProbabilityConsumer(run["output_dir"], label, epsilon_mode))
+        if "kymograph" in analyses:
+            consumers.append(kymograph.KymographConsumer(os.path.join(run["output_dir"], f"kymo_data_{run['re']}_rep_{run['replicate']}.npz"),
+                                                         os.path.join(run["output_dir"], "kymograph.svg")))
+        if "partition" in analyses:
+            consumers.append(partition_calculation.PartitionConsumer(run["output_dir"]))
+        if options["store"]:
+            store = ResultStore(os.path.join(run["output_dir"], "results.db"))
+        profile_log = os.path.join(run["output_dir"], "profile.jsonl") if options["profile"] else None
+        start = time.perf_counter()
+        n_frames, outputs = run_engine(run["directory"], consumers, store=store, epsilon_mode=options["epsilon_mode"],
+                                       epsilon_block=options["epsilon_block"], epsilon_sample=options["epsilon_sample"], profile_log=profile_log,
+                                       method=options["method"])
+        seconds = time.perf_counter() - start
+        row.update(frames=n_frames, seconds=seconds, frames_per_second=n_frames / seconds)
+        if "force" in outputs:
+            row.update(force_mean=float(outputs["force"].mean), force_std=float(outputs["force"].std()))
+            #error bars of the mean force which account for the correlation between frames
+            force = force_pn(force_consumer.mean_bond_length.values(), run["l_0"])
+            if len(force) >= 2 * ERROR_BLOCKS:
+                force_errors = summarize(force, ERROR_BLOCKS, seed=ERROR_SEED).iloc[0]
+                row.update(force_se_block=force_errors['se_block'], force_tau=force_errors['tau'],
+                           force_ci_low=force_errors['ci_low'], force_ci_high=force_errors['ci_high'])
+        if "probability" in outputs:
+            probability = outputs["probability"]
+            row.update(mean_probability=float(probability.mean()), condensed_monomers=int(np.count_nonzero(probability.to_numpy() >= 0.5)))
+        if "partition" in outputs:
+            row.update(partition_calculation.window_means(outputs["partition"]))
+    except Exception as e:
+        row["status"] = f"error: {e}"
+    finally:
+        if store is not None:
+            store.close()
+    return row
+
+
+def run_sweep(runs, analyses=ANALYSES, jobs=None, results_path="sweep_results.csv", options=None):
+    """Analyse every run on a pool of jobs processes and write the summary table; returns it as a DataFrame."""
+    options = {"store": False, "profile": False, "method": "dbscan", "epsilon_mode": "frame", "epsilon_block": 100, "epsilon_sample": 20, **(options or {})}
+    items = [(k, run, analyses, options) for k, run in enumerate(runs)]
+    rows = []
+    #one run per task and a fresh process for every run, so that nothing of a finished run stays in memory
+    with Pool(processes=jobs or os.cpu_count(), maxtasksperchild=1) as pool:
+        for row in pool.imap_unordered(analyse, items, chunksize=1):
+            rows.append(row)
+            print(f"[{len(rows)}/{len(items)}] {row['output_dir']}: {row['status']}")
+            #the table is rewritten after every run, so an interrupted sweep keeps the finished runs
+            results = pd.DataFrame(rows).sort_values("run")
+            results.to_csv(results_path, index=False)
+    return pd.DataFrame(rows).sort_values("run").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse all runs of a parameter sweep listed in a CSV manifest.")
+    parser.add_argument("manifest", help="CSV file with the columns sequence, re, concentration, replicate, directory[, output_dir][, l_0]")
+    parser.add_argument("--analyses", default=",".join(ANALYSES), help="comma separated list of the analyses to run (force, probability, kymograph, partition)")
+    parser.add_argument("--jobs", type=int, default=None, help="number of runs analysed at the same time (default: number of cores)")
+    parser.add_argument("--output-root", default="sweep_output", help="parent directory of the run outputs when the manifest gives no output_dir")
+    parser.add_argument("--results", default="sweep_results.csv", help="summary table with one row per run")
+    parser.add_argument("--store", action="store_true", help="keep per-frame results in output_dir/results.db, so a rerun only analyses new frames")
+    parser.add_argument("--profile", action="store_true", help="write the stage timings and counters of every run to output_dir/profile.jsonl")
+    parser.add_argument("--dry-run", action="store_true", help="only list the runs of the manifest")
+    add_epsilon_arguments(parser)
+    args = parser.parse_args()
+
+    analyses = [a.strip() for a in args.analyses.split(",")]
+    unknown = set(analyses) - set(ANALYSES)
+    if unknown:
+        parser.error(f"unknown analyses {sorted(unknown)}, expected some of {ANALYSES}")
+    runs = read_manifest(args.manifest, args.output_root)
+    if args.dry_run:
+        print(pd.DataFrame(runs).to_string())
+    else:
+        options = {"store": args.store, "profile": args.profile, "method": args.method, "epsilon_mode": args.epsilon_mode, "epsilon_block": args.epsilon_block, "epsilon_sample": args.epsilon_sample}
+        run_sweep(runs, analyses, args.jobs, args.results, options)
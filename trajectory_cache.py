@@ -0,0 +1,178 @@
+###############################################################################################################################################################
+#Binary trajectory cache for a directory of config_* text frames.
+#A run is parsed once and packed into a cache directory containing:
+#   positions.npy : (frames, particles, 3) positions, read back as a read-only np.memmap
+#   ids.npy       : particle IDs, stored once per run
+#   types.npy     : type IDs, stored once per run
+#   index.csv     : frame number, original file name and byte offset of the frame inside positions.npy
+#The analysis scripts use iter_frames, which accepts either a text directory or a cache directory, so re-analysis only reads the memory-mapped array.
+#Binary trajectories written by the simulation scripts (see binary_trajectory.py) are read the same way as a cache.
+#Usage: python trajectory_cache.py /path/to/output_files/ /path/to/run.traj [--float32]
+###############################################################################################################################################################
+
+import argparse
+import csv
+import os
+import numpy as np
+from blockfile_reader import read_blockfile, read_blockfile_rows, list_frames, frame_number
+from binary_trajectory import BinaryTrajectory, is_binary_trajectory
+
+POSITIONS = "positions.npy"
+IDS = "ids.npy"
+TYPES = "types.npy"
+INDEX = "index.csv"
+
+
+def is_trajectory_cache(path):
+    return os.path.isfile(os.path.join(path, INDEX)) and os.path.isfile(os.path.join(path, POSITIONS))
+
+
+def ingest_directory(directory, cache_path, dtype=np.float64):
+    """
+    Parse every configuration in directory once and write the cache to cache_path.
+    All frames must contain the same particles in the same order, since ids and types are stored only once.
+    Returns the number of frames written.
+    """
+    frames = list_frames(directory)
+    if not frames:
+        raise ValueError(f"no configuration files found in {directory}")
+    os.makedirs(cache_path, exist_ok=True)
+
+    ids, positions, types = read_blockfile(frames[0], dtype=dtype)
+    store = np.lib.format.open_memmap(os.path.join(cache_path, POSITIONS), mode="w+",
+                                      dtype=dtype, shape=(len(frames),) + positions.shape)
+    frame_bytes = positions.nbytes
+    data_offset = store.offset
+
+    rows = []
+    for k, f in enumerate(frames):
+        if k:
+            frame_ids, positions, frame_types = read_blockfile(f, dtype=dtype)
+            if not (np.array_equal(frame_ids, ids) and np.array_equal(frame_types, types)):
+                raise ValueError(f"{f} does not contain the same particles as {frames[0]}")
+        store[k] = positions
+        rows.append((frame_number(f), os.path.basename(f), data_offset + k * frame_bytes))
+    store.flush()
+    del store
+
+    np.save(os.path.join(cache_path, IDS), ids)
+    np.save(os.path.join(cache_path, TYPES), types)
+    with open(os.path.join(cache_path, INDEX), "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["frame", "filename", "offset"])
+        writer.writerows(rows)
+    return len(frames)
+
+
+class Trajectory:
+    """Read-only view of a trajectory cache. Positions are memory-mapped, so indexing a frame does not copy data."""
+
+    def __init__(self, cache_path):
+        self.path = cache_path
+        self.positions = np.load(os.path.join(cache_path, POSITIONS), mmap_mode="r")
+        self.ids = np.load(os.path.join(cache_path, IDS))
+        self.types = np.load(os.path.join(cache_path, TYPES))
+        with open(os.path.join(cache_path, INDEX), newline="") as fh:
+            rows = list(csv.DictReader(fh))
+        self.frame_numbers = np.array([int(row["frame"]) for row in rows], dtype=np.int64)
+        self.filenames = [row["filename"] for row in rows]
+        self.offsets = np.array([int(row["offset"]) for row in rows], dtype=np.int64)
+        if len(rows) != len(self.positions):
+            raise ValueError(f"index of {cache_path} does not match {POSITIONS}")
+
+    def __len__(self):
+        return len(self.positions)
+
+    def frame(self, k):
+        return self.ids, self.positions[k], self.types
+
+    def lookup(self, number):
+        """Position in the cache of the frame with file number `number`."""
+        matches = np.flatnonzero(self.frame_numbers == number)
+        if not len(matches):
+            raise KeyError(number)
+        return int(matches[0])
+
+    def signature(self, k):
+        """Signature of frame k for the result store: modification time and size of positions.npy and the frame position."""
+        st = os.stat(os.path.join(self.path, POSITIONS))
+        return f"{st.st_mtime_ns}:{st.st_size}:{k}"
+
+
+#caches opened by load_frame, kept per process so pool workers map each cache only once
+_open_caches = {}
+
+
+def list_frame_refs(source):
+    """
+    References to every frame of a run in natsort order, for load_frame.
+    A reference is the file path for a text directory and (cache path, frame position) for a trajectory cache or binary trajectory.
+    """
+    if is_trajectory_cache(source) or is_binary_trajectory(source):
+        n = len(open_trajectory(source))
+        return [(source, k) for k in range(n)]
+    return list_frames(source)
+
+
+def open_trajectory(source):
+    """Trajectory cache or binary trajectory of a directory."""
+    if is_binary_trajectory(source):
+        return BinaryTrajectory(source)
+    return Trajectory(source)
+
+
+def open_cache(source):
+    """Trajectory of a cache directory, opened once per process."""
+    if source not in _open_caches:
+        _open_caches[source] = open_trajectory(source)
+    return _open_caches[source]
+
+
+def frame_name(ref):
+    """File name (path) of the frame a reference points to."""
+    if isinstance(ref, tuple):
+        source, k = ref
+        return os.path.join(source, open_cache(source).filenames[k])
+    return ref
+
+
+def load_frame(ref, dtype=np.float64, rows=None):
+    """
+    Return (name, ids, positions, types) for a reference made by list_frame_refs.
+    With rows (blockfile_reader.select_rows of the first frame; every frame lists the particles in the same order)
+    only these particle rows are read, e.g. only the monomers.
+    """
+    if isinstance(ref, tuple):
+        source, k = ref
+        ids, positions, types = open_cache(source).frame(k)
+        if rows is not None:
+            ids, positions, types = ids[rows], positions[rows], types[rows]
+        return frame_name(ref), ids, positions, types
+    if rows is not None:
+        ids, positions, types = read_blockfile_rows(ref, rows, dtype=dtype)
+    else:
+        ids, positions, types = read_blockfile(ref, dtype=dtype)
+    return ref, ids, positions, types
+
+
+def iter_frames(source, dtype=np.float64, rows=None):
+    """
+    Yield (name, ids, positions, types) for every frame of a run in natsort order.
+    source is either a directory of config_* text files or a trajectory cache made by ingest_directory.
+    """
+    for ref in list_frame_refs(source):
+        yield load_frame(ref, dtype=dtype, rows=rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a directory of config_* frames into a memory-mapped trajectory cache.")
+    parser.add_argument("directory", help="directory with the config_* output files")
+    parser.add_argument("cache", help="cache directory to create")
+    parser.add_argument("--float32", action="store_true", help="store positions as float32 (half the size)")
+    args = parser.parse_args()
+    n = ingest_directory(args.directory, args.cache, dtype=np.float32 if args.float32 else np.float64)
+    print(f"{n} frames written to {args.cache}")
+
+
+if __name__ == "__main__":
+    main()